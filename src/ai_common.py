@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+ai_model_processor.py 和 single_test.py 共用的工具函数
+JSON解析、Base64编码、图片缩小、图片MIME类型判断和重试等待时间计算
+"""
+
+import json
+import yaml
+import time
+import os
+import random
+import base64
+import mimetypes
+import functools
+import io
+import re
+from typing import Dict, Any, Optional, Tuple, Union
+from email.utils import parsedate_to_datetime
+
+# 尝试导入orjson用于加速JSON序列化和解析（可选）
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# 尝试导入pybase64用于SIMD加速的Base64编码（可选）
+try:
+    import pybase64
+    HAS_PYBASE64 = True
+except ImportError:
+    HAS_PYBASE64 = False
+
+# 尝试导入Pillow用于缩小过大的图片（可选，配置 max_image_dim 启用）
+try:
+    from PIL import Image
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+
+# YAML解析器: 有LibYAML时使用C实现
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# 可重试的HTTP状态码（限流和服务端临时错误），其余4xx直接失败
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# 服务端要求的Retry-After超过该秒数时放弃重试（providers.yaml中可用retry_after_cap覆盖）
+DEFAULT_RETRY_AFTER_CAP = 120
+
+# OpenAI兼容接口可以接收的图片格式（Anthropic/Gemini按识别出的MIME类型发送）
+SUPPORTED_IMAGE_TYPES = frozenset(['image/jpeg', 'image/png', 'image/gif', 'image/webp'])
+
+# AI响应中的 ```json ... ``` 代码块
+JSON_CODE_BLOCK_RE = re.compile(r'```json\s*(.*?)\s*```', re.DOTALL)
+
+# 查找顶层JSON对象时只需关注的字符：括号、引号和转义符
+JSON_SCAN_RE = re.compile(r'[{}"\\]')
+
+# 分块编码图片时每次读取的字节数，须为3的倍数，使各块的编码结果可以直接拼接
+IMAGE_READ_CHUNK = 3 * 64 * 1024
+
+# 缩小图片后重新编码JPEG的质量
+DOWNSCALE_JPEG_QUALITY = 85
+
+
+def json_loads(content: Union[str, bytes]) -> Any:
+    """解析JSON，优先使用orjson，失败时回退到标准库以保留原有的容错和错误信息"""
+    if HAS_ORJSON:
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(content)
+
+
+def json_dumps(data: Any) -> bytes:
+    """将数据（请求体、结果记录）序列化为UTF-8编码的JSON，优先使用orjson"""
+    if HAS_ORJSON:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def iter_json_spans(text: str):
+    """
+    依次返回文本中括号配对完整的顶层 {...} 片段的 (start, end)
+    
+    只用正则跳到 { } " \\ 这几个字符上处理，并跟踪字符串状态，
+    字符串内的括号不参与计数；对象外的引号（普通文字）也不影响匹配
+    """
+    depth = 0
+    start = 0
+    in_string = False
+    skip_until = -1
+    for match in JSON_SCAN_RE.finditer(text):
+        pos = match.start()
+        if pos < skip_until:
+            continue
+        char = match.group()
+        if in_string:
+            if char == '\\':
+                # 跳过被转义的下一个字符
+                skip_until = pos + 2
+            elif char == '"':
+                in_string = False
+        elif char == '{':
+            if depth == 0:
+                start = pos
+            depth += 1
+        elif depth > 0:
+            if char == '"':
+                in_string = True
+            elif char == '}':
+                depth -= 1
+                if depth == 0:
+                    yield start, pos + 1
+
+
+def iter_json_candidates(text: str):
+    """
+    按优先级依次返回可能是AI结果的JSON片段：整段对象、```json 代码块、括号配对完整的顶层对象
+    
+    只返回顶层片段，解析失败时不会退回到对象内部，避免把嵌套的子对象当成结果
+    """
+    if text.startswith('{') and text.endswith('}'):
+        yield text
+    match = JSON_CODE_BLOCK_RE.search(text)
+    if match:
+        yield match.group(1)
+    # 逐个尝试括号配对完整的对象，避免文字中零散的括号或多个对象拼成无效片段
+    for start, end in iter_json_spans(text):
+        yield text[start:end]
+
+
+def parse_json_object(content: str) -> Tuple[Optional[Dict[str, Any]], Optional[json.JSONDecodeError]]:
+    """
+    从AI响应中解析出第一个JSON对象
+    
+    Returns:
+        (对象, None)；都失败时返回 (None, 第一个解析错误)，没有像JSON的片段时错误也为None
+    """
+    error = None
+    for candidate in iter_json_candidates(content.strip()):
+        try:
+            result = json_loads(candidate)
+        except json.JSONDecodeError as e:
+            # 多个对象、夹杂文字或代码块被截断等情况，继续尝试下一个片段
+            error = error or e
+            continue
+        if isinstance(result, dict):
+            return result, None
+    return None, error
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After响应头（秒数或HTTP日期），返回需要等待的秒数，无法解析时返回None"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+def compute_retry_delay(provider_config: Dict[str, Any], attempt: int,
+                        retry_after: Optional[float] = None) -> Optional[float]:
+    """
+    计算第attempt次失败后的等待时间
+    
+    使用截断指数退避+全抖动，避免多个线程同时失败后又同时醒来重试；
+    服务端给出Retry-After时以它为下限，超过retry_after_cap秒时返回None表示放弃重试，
+    避免错误的Retry-After让调用方长时间阻塞
+    """
+    retry_delay = provider_config.get("retry_delay", 2)
+    retry_cap = provider_config.get("retry_cap", 30)
+    delay = random.uniform(0, min(retry_cap, retry_delay * (2 ** attempt)))
+    
+    if retry_after is not None:
+        if retry_after > provider_config.get("retry_after_cap", DEFAULT_RETRY_AFTER_CAP):
+            return None
+        delay = max(delay, retry_after)
+    
+    return delay
+
+
+def b64encode_str(data: bytes) -> str:
+    """Base64编码为字符串，优先使用pybase64（大图片编码快数倍）"""
+    if HAS_PYBASE64:
+        return pybase64.b64encode(data).decode('ascii')
+    return base64.b64encode(data).decode('ascii')
+
+
+def b64encode_stream(f: io.BufferedIOBase, head: bytes = b"") -> str:
+    """
+    分块读取文件对象并Base64编码，避免整个原始数据和编码结果同时驻留内存
+    
+    Args:
+        f: 以二进制方式打开的文件对象
+        head: 调用方已经从f中读出的开头部分（长度须为3的倍数），会先编码
+    """
+    encode = pybase64.b64encode if HAS_PYBASE64 else base64.b64encode
+    buf = bytearray(encode(head))
+    while True:
+        chunk = f.read(IMAGE_READ_CHUNK)
+        if not chunk:
+            break
+        buf += encode(chunk)
+    return buf.decode('ascii')
+
+
+def b64encode_file(path: str) -> str:
+    """分块读取文件并Base64编码"""
+    with open(path, 'rb') as f:
+        return b64encode_stream(f)
+
+
+def downscale_image(path: str, max_dim: int) -> Optional[bytes]:
+    """
+    长边超过max_dim的图片等比缩小并重新编码为JPEG
+    
+    Returns:
+        JPEG数据，图片不需要缩小时返回None（由调用方直接编码原文件）
+    """
+    with Image.open(path) as img:
+        if max(img.size) <= max_dim:
+            return None
+        img.thumbnail((max_dim, max_dim))
+        buf = io.BytesIO()
+        img.convert('RGB').save(buf, format='JPEG', quality=DOWNSCALE_JPEG_QUALITY, optimize=True)
+        return buf.getvalue()
+
+
+def is_image_url(image_path: str) -> bool:
+    """判断图片是否为远程http(s)地址"""
+    return image_path.startswith(("http://", "https://"))
+
+
+@functools.lru_cache(maxsize=64)
+def guess_mime_for_ext(ext: str) -> Optional[str]:
+    """按扩展名（小写，含点）查询MIME类型，结果缓存"""
+    return mimetypes.guess_type('x' + ext)[0]
+
+
+def guess_image_mime(image_path: str) -> Optional[str]:
+    """根据文件扩展名判断图片的MIME类型，无法识别时返回None"""
+    return guess_mime_for_ext(os.path.splitext(image_path)[1].lower())
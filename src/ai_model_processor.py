@@ -10,24 +10,43 @@ AI模型调用脚本
 
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import yaml
+import copy
 import time
 import os
 import sys
-import base64
-import mimetypes
+import hashlib
+import sqlite3
+import functools
 import io
 import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+import gzip
 import re
-from typing import Dict, Any, Optional, Tuple, List, Union
+from typing import Dict, Any, Optional, Tuple, List, Union, Callable
 from tqdm import tqdm
 import argparse
 import logging
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
 import threading
+import asyncio
+import atexit
+import queue
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from threading import Lock
+from collections import OrderedDict
+
+# 与single_test.py共用的JSON解析、Base64编码、图片和重试工具
+from ai_common import (
+    HAS_PIL, YAML_LOADER, RETRYABLE_STATUS_CODES, SUPPORTED_IMAGE_TYPES,
+    json_loads, json_dumps, parse_json_object, parse_retry_after, compute_retry_delay,
+    b64encode_str, b64encode_stream, b64encode_file, downscale_image,
+    is_image_url, guess_image_mime,
+)
 
 # 尝试导入openpyxl用于处理Excel文件
 try:
@@ -38,6 +57,108 @@ try:
 except ImportError:
     HAS_OPENPYXL = False
 
+# 尝试导入python-calamine用于加速Excel读取（可选，Rust实现，需pandas>=2.2）
+try:
+    import python_calamine
+    # pandas<2.2 不认识engine='calamine'，此时仍回退到openpyxl
+    HAS_CALAMINE = tuple(int(v) for v in pd.__version__.split('.')[:2]) >= (2, 2)
+except ImportError:
+    HAS_CALAMINE = False
+
+# 尝试导入pyarrow用于加速CSV读取（可选）
+try:
+    import pyarrow
+    import pyarrow.parquet
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# 尝试导入aiohttp用于异步并发请求（可选，配置 async_mode: true 启用）
+try:
+    import aiohttp
+    HAS_AIOHTTP = True
+except ImportError:
+    HAS_AIOHTTP = False
+
+# 尝试导入httpx用于HTTP/2多路复用（可选，配置 http2: true 启用，需安装 httpx[http2]）
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
+
+# 异步模式使用的HTTP会话：默认aiohttp，配置 http2: true 时为httpx异步客户端
+AsyncSession = Union["aiohttp.ClientSession", "httpx.AsyncClient"]
+
+# 一行的图片数据: data URL / 远程地址 / 文件路径字符串，或Excel嵌入图片的 (Base64, MIME类型)
+ImageData = Union[str, Tuple[str, str]]
+
+# 所有API请求共用的请求头，响应体较长时压缩传输
+DEFAULT_HEADERS = {"Content-Type": "application/json", "Accept-Encoding": "gzip, deflate"}
+
+# 同步请求中按网络错误重试的异常（含响应体不是合法JSON）
+HTTP_ERRORS = (requests.exceptions.RequestException, json.JSONDecodeError) + ((httpx.HTTPError,) if HAS_HTTPX else ())
+
+# 异步请求中按网络错误重试的异常（含超时和响应体不是合法JSON）
+ASYNC_HTTP_ERRORS = ((asyncio.TimeoutError, ValueError)
+                     + ((aiohttp.ClientError,) if HAS_AIOHTTP else ())
+                     + ((httpx.HTTPError,) if HAS_HTTPX else ()))
+
+# 开启请求体压缩时，只压缩超过该字节数的请求体（小请求压缩的CPU开销不划算）
+GZIP_MIN_BODY_SIZE = 16 * 1024
+
+# 结果文件最短flush间隔（秒）
+RESULTS_FLUSH_INTERVAL = 1.0
+
+# 计算缓存键时图片数据每次编码并哈希的字符数，不必为（可能有数MB的）Base64整体生成一份字节副本
+CACHE_KEY_HASH_CHUNK = 1024 * 1024
+
+# 响应列的字符串类型: 有pyarrow时使用Arrow字符串，省去每个单元格一个Python对象的开销
+RESPONSE_DTYPE = "string[pyarrow]" if HAS_PYARROW else "string"
+
+
+# xlsx压缩包中图片文件名里的序号（xl/media/image3.png -> 3）
+MEDIA_IMAGE_NUM_RE = re.compile(r'image(\d+)')
+
+
+def split_data_url(data_url: str) -> Optional[Tuple[str, str]]:
+    """
+    拆分Base64 data URL (data:image/png;base64,xxxxx)，返回 (Base64数据, MIME类型)
+    
+    用str.partition定位分隔符，不用正则扫描整段（可能有数MB的）Base64数据
+    """
+    head, sep, base64_data = data_url.partition(";base64,")
+    mime_type = head[len("data:"):]
+    if not sep or not mime_type or not base64_data:
+        return None
+    return base64_data, mime_type
+
+
+@functools.lru_cache(maxsize=16)
+def _load_yaml_cached(path: str, mtime_ns: int, size: int) -> Any:
+    """按 (路径, 修改时间, 大小) 缓存YAML解析结果，文件变化后自动重新解析"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return yaml.load(f, Loader=YAML_LOADER)
+
+
+def load_yaml_file(path: str) -> Any:
+    """
+    读取YAML文件，同一进程内重复加载未修改的文件时不再重新解析
+    
+    返回缓存结果的深拷贝，调用方可以随意修改
+    """
+    stat = os.stat(path)
+    return copy.deepcopy(_load_yaml_cached(os.path.abspath(path), stat.st_mtime_ns, stat.st_size))
+
+
+# xlsx中drawing相关XML的命名空间
+XDR_NS = "http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing"
+DRAWINGML_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
+OFFICE_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PACKAGE_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+# 带起始单元格的图片锚点（absoluteAnchor没有单元格位置，忽略）
+XDR_ANCHOR_TAGS = (f"{{{XDR_NS}}}twoCellAnchor", f"{{{XDR_NS}}}oneCellAnchor")
+
 
 class ExcelImageExtractor:
     """从Excel文件中提取嵌入的图片"""
@@ -50,7 +171,7 @@ class ExcelImageExtractor:
             excel_path: Excel文件路径
         """
         self.excel_path = excel_path
-        self.images: Dict[str, str] = {}  # 单元格位置 -> Base64图片数据
+        self.images: Dict[int, Tuple[str, str]] = {}  # 行号(1-indexed) -> (Base64图片数据, MIME类型)
         self._extract_images()
     
     def _extract_images(self):
@@ -59,6 +180,15 @@ class ExcelImageExtractor:
             return
         
         try:
+            # 没有媒体文件时不可能有嵌入图片，省去openpyxl再完整解析一遍工作簿
+            # （.xls不是zip格式，openpyxl也无法读取其中的图片）
+            try:
+                with zipfile.ZipFile(self.excel_path, 'r') as zf:
+                    if not any(name.startswith('xl/media/') for name in zf.namelist()):
+                        return
+            except zipfile.BadZipFile:
+                return
+            
             # 方法1: 使用openpyxl提取图片
             self._extract_with_openpyxl()
             
@@ -72,7 +202,8 @@ class ExcelImageExtractor:
     def _extract_with_openpyxl(self):
         """使用openpyxl提取图片"""
         try:
-            wb = load_workbook(self.excel_path)
+            # 图片需要非只读模式才能读到；公式只取缓存值、不加载外部链接，减少解析量
+            wb = load_workbook(self.excel_path, data_only=True, keep_links=False)
             
             for sheet_name in wb.sheetnames:
                 sheet = wb[sheet_name]
@@ -107,11 +238,10 @@ class ExcelImageExtractor:
                         if image_data:
                             # 确定MIME类型
                             mime_type = self._detect_image_mime(image_data)
-                            base64_data = base64.b64encode(image_data).decode('utf-8')
+                            base64_data = b64encode_str(image_data)
                             
                             # 存储: 使用行号作为key (便于后续匹配)
-                            cell_key = f"{row}"
-                            self.images[cell_key] = f"data:{mime_type};base64,{base64_data}"
+                            self.images[row] = (base64_data, mime_type)
                             
                     except Exception as e:
                         continue
@@ -129,69 +259,38 @@ class ExcelImageExtractor:
                 # 查找所有图片文件
                 image_files = [f for f in zf.namelist() if f.startswith('xl/media/')]
                 
-                # 读取drawing关系文件，找到图片与单元格的对应关系
-                drawing_rels = {}
-                for name in zf.namelist():
-                    if 'drawings/_rels' in name and name.endswith('.rels'):
-                        try:
-                            rels_content = zf.read(name).decode('utf-8')
-                            # 解析关系文件
-                            for match in re.finditer(r'Id="(rId\d+)"[^>]*Target="([^"]+)"', rels_content):
-                                rel_id = match.group(1)
-                                target = match.group(2).replace('../media/', '')
-                                drawing_rels[rel_id] = target
-                        except:
-                            pass
-                
-                # 读取drawing文件，找到图片位置
+                # 逐个解析drawing文件及其关系文件，找到图片与单元格的对应关系
                 image_positions = {}
                 for name in zf.namelist():
                     if 'drawings/drawing' in name and name.endswith('.xml'):
                         try:
-                            drawing_content = zf.read(name).decode('utf-8')
-                            
-                            # 查找所有anchor及其关联的图片
-                            # 匹配 <xdr:from><xdr:col>X</xdr:col><xdr:row>Y</xdr:row>
-                            anchor_pattern = re.compile(
-                                r'<xdr:from>\s*<xdr:col>(\d+)</xdr:col>[^<]*<xdr:colOff>[^<]*</xdr:colOff>\s*'
-                                r'<xdr:row>(\d+)</xdr:row>.*?<a:blip[^>]*r:embed="(rId\d+)"',
-                                re.DOTALL
-                            )
-                            
-                            for match in anchor_pattern.finditer(drawing_content):
-                                col = int(match.group(1)) + 1  # 转为1-indexed
-                                row = int(match.group(2)) + 1
-                                rel_id = match.group(3)
-                                
-                                if rel_id in drawing_rels:
-                                    image_name = drawing_rels[rel_id]
-                                    image_positions[f"xl/media/{image_name}"] = row
-                                    
+                            self._parse_drawing(zf, name, image_positions)
                         except Exception as e:
                             pass
                 
-                # 读取并编码图片
+                # 读取并编码图片：按块解压编码，不把整个压缩条目读入内存
                 for image_file in image_files:
                     try:
-                        image_data = zf.read(image_file)
-                        mime_type = self._detect_image_mime(image_data)
-                        base64_data = base64.b64encode(image_data).decode('utf-8')
+                        with zf.open(image_file) as fh:
+                            # 文件头足够判断格式，12字节也是3的倍数，可以直接接着分块编码
+                            header = fh.read(12)
+                            mime_type = self._detect_image_mime(header)
+                            base64_data = b64encode_stream(fh, head=header)
                         
                         # 如果有位置信息，使用行号作为key
                         if image_file in image_positions:
                             row = image_positions[image_file]
-                            cell_key = f"{row}"
                         else:
                             # 否则使用文件名中的数字
-                            match = re.search(r'image(\d+)', image_file)
+                            match = MEDIA_IMAGE_NUM_RE.search(image_file)
                             if match:
                                 # 假设图片按顺序对应行号（从第2行开始，第1行是标题）
                                 image_num = int(match.group(1))
-                                cell_key = f"{image_num + 1}"  # +1 因为标题行
+                                row = image_num + 1  # +1 因为标题行
                             else:
                                 continue
                         
-                        self.images[cell_key] = f"data:{mime_type};base64,{base64_data}"
+                        self.images[row] = (base64_data, mime_type)
                         
                     except Exception as e:
                         continue
@@ -199,6 +298,36 @@ class ExcelImageExtractor:
         except Exception as e:
             pass
     
+    def _parse_drawing(self, zf: zipfile.ZipFile, name: str, image_positions: Dict[str, int]):
+        """
+        流式解析一个drawing文件，把 {压缩包内图片路径: 行号(1-indexed)} 写入image_positions
+        
+        使用iterparse逐个处理锚点，处理完立即清理，内存占用与drawing大小无关
+        """
+        # drawing的关系文件: xl/drawings/_rels/drawing1.xml.rels，
+        # Target一般相对于xl/drawings/（如 ../media/image1.png），也可能是以/开头的包内绝对路径
+        drawing_dir = posixpath.dirname(name)
+        rels_name = posixpath.join(drawing_dir, "_rels", posixpath.basename(name) + ".rels")
+        rels = {}
+        if rels_name in zf.namelist():
+            with zf.open(rels_name) as fh:
+                for _, el in ET.iterparse(fh):
+                    if el.tag == f"{{{PACKAGE_REL_NS}}}Relationship":
+                        target = posixpath.join("/" + drawing_dir, el.get("Target", ""))
+                        rels[el.get("Id")] = posixpath.normpath(target).lstrip("/")
+        
+        with zf.open(name) as fh:
+            for _, el in ET.iterparse(fh):
+                if el.tag not in XDR_ANCHOR_TAGS:
+                    continue
+                row = el.find(f"{{{XDR_NS}}}from/{{{XDR_NS}}}row")
+                blip = el.find(f".//{{{DRAWINGML_NS}}}blip")
+                if row is not None and blip is not None:
+                    target = rels.get(blip.get(f"{{{OFFICE_REL_NS}}}embed"))
+                    if target:
+                        image_positions[target] = int(row.text) + 1  # 转为1-indexed
+                el.clear()
+    
     def _detect_image_mime(self, image_data: bytes) -> str:
         """检测图片的MIME类型"""
         # 检查文件头
@@ -223,7 +352,12 @@ class ExcelImageExtractor:
         Returns:
             Base64编码的图片数据URL，如果没有图片则返回None
         """
-        return self.images.get(str(row))
+        image = self.images.get(row)
+        if not image:
+            return None
+        # 只在需要时拼出data URL，提取时不为每张图片多保存一份
+        base64_data, mime_type = image
+        return f"data:{mime_type};base64,{base64_data}"
     
     def get_image_base64_raw(self, row: int) -> Optional[Tuple[str, str]]:
         """
@@ -235,18 +369,7 @@ class ExcelImageExtractor:
         Returns:
             (base64_data, mime_type) 元组，如果没有图片则返回None
         """
-        data_url = self.images.get(str(row))
-        if not data_url:
-            return None
-        
-        # 解析data URL: data:image/png;base64,xxxxx
-        match = re.match(r'data:([^;]+);base64,(.+)', data_url)
-        if match:
-            mime_type = match.group(1)
-            base64_data = match.group(2)
-            return base64_data, mime_type
-        
-        return None
+        return self.images.get(row)
     
     def has_images(self) -> bool:
         """检查是否成功提取到图片"""
@@ -257,6 +380,88 @@ class ExcelImageExtractor:
         return len(self.images)
 
 
+class RateLimiter:
+    """令牌桶限速器（线程安全），限制全局请求速率，空闲时不需要预先等待"""
+    
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        初始化限速器
+        
+        Args:
+            rate: 每秒允许的请求数
+            burst: 令牌桶容量，即空闲后允许连续发出的请求数
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+        self.lock = Lock()
+    
+    def reserve(self) -> float:
+        """预约一个令牌，返回需要等待的秒数（令牌不足时记为欠账，后来者依次排队）"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+    
+    def acquire(self):
+        """获取令牌，必要时阻塞等待"""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+    
+    async def acquire_async(self):
+        """获取令牌（异步），必要时等待"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class ResponseCache:
+    """基于sqlite的API响应缓存（线程安全），相同的请求跨运行、跨文件复用已有结果"""
+    
+    def __init__(self, db_path: str):
+        """
+        初始化响应缓存
+        
+        Args:
+            db_path: sqlite数据库文件路径，不存在时自动创建
+        """
+        self.db_path = db_path
+        self.hits = 0
+        self.lock = Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL)")
+        self.conn.commit()
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """查询缓存，未命中返回None"""
+        with self.lock:
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.hits += 1
+        return json_loads(row[0])
+    
+    def set(self, key: str, result: Dict[str, Any]):
+        """写入缓存"""
+        response = json_dumps(result).decode('utf-8')
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO responses (key, response) VALUES (?, ?)", (key, response))
+            self.conn.commit()
+    
+    def close(self):
+        """关闭数据库连接"""
+        with self.lock:
+            self.conn.close()
+
+
 class AIModelProcessor:
     def __init__(self, config_file: str = "config.yaml", providers_file: str = "providers.yaml"):
         """初始化AI模型处理器"""
@@ -264,8 +469,23 @@ class AIModelProcessor:
         self.providers = self.load_providers(providers_file)
         self.provider_config = self.get_provider_config()
         self.setup_logging()
-        self.csv_lock = Lock()  # CSV/Excel文件写入锁
         self.excel_image_extractor: Optional[ExcelImageExtractor] = None  # Excel图片提取器
+        self._results_fh = None  # 处理过程中追加写入结果的JSONL文件句柄
+        self._results_flushed_at = 0.0  # 结果文件上次flush的时间
+        self._thread_local = threading.local()  # 各工作线程自己的requests会话
+        self._http_adapter: Optional[HTTPAdapter] = None  # 所有线程会话共享的连接池
+        self.session = self.create_session()  # 复用连接的HTTP会话
+        self.breaker_lock = Lock()  # 熔断器状态锁
+        self._breaker = {"fails": 0, "open_until": 0.0}  # 连续失败次数 / 熔断截止时间
+        self.rate_limiter: Optional[RateLimiter] = None  # 全局请求限速器，每次处理前按配置创建
+        self._system_prompt_cache: Dict[str, str] = {}  # 提示词文件路径 -> 系统提示词
+        self._response_columns: Dict[str, str] = {}  # 模型名 -> 响应列名
+        self._request_templates: Dict[str, Tuple[str, Dict[str, Any], Dict[str, str]]] = {}  # 系统提示词 -> 请求模板
+        self._api_handlers: Optional[Tuple[Callable, Callable]] = None  # 当前api_type的 (请求构建, 响应提取)
+        self.image_cache_lock = Lock()  # 图片编码缓存锁
+        self._image_cache: "OrderedDict[Tuple[str, int, int], Tuple[str, str]]" = OrderedDict()  # (路径, 修改时间, 大小) -> (Base64, MIME类型)
+        cache_file = self.config.get("response_cache", "")
+        self.response_cache: Optional[ResponseCache] = ResponseCache(cache_file) if cache_file else None
         
     def load_config(self, config_file: str) -> Dict[str, Any]:
         """加载运行配置文件"""
@@ -283,13 +503,26 @@ class AIModelProcessor:
             "image_base_path": "",
             "image_detail": "auto",
             "max_workers": 3,
-            "request_delay": 0.5
+            "request_delay": 0.5,
+            "rate_limit": 0,  # 全局每秒请求数上限，0表示按request_delay换算
+            "circuit_breaker_threshold": 10,  # 连续失败多少次后熔断
+            "circuit_breaker_cooldown": 60,  # 熔断持续秒数
+            "async_mode": False,  # 使用asyncio + aiohttp替代线程池（需安装aiohttp）
+            "async_concurrency": 0,  # 异步模式同时在途的请求数，0表示使用max_workers
+            "dedupe_prompts": True,  # 相同提示词和图片的行只请求一次
+            "chunk_size": 0,  # CSV分块处理的行数，0表示整表读入
+            "output_format": "",  # 输出格式，空表示写回输入文件，parquet表示CSV结果另存为Parquet
+            "http2": False,  # 使用httpx的HTTP/2客户端（需安装 httpx[http2]）
+            "gzip_requests": False,  # 较大的请求体（如带图片）gzip压缩后上传，需服务端支持
+            "log_level": "INFO",  # 日志级别: DEBUG, INFO, WARNING, ERROR
+            "response_cache": "",  # API响应缓存的sqlite文件路径，留空不启用
+            "image_cache_size": 64,  # 内存中缓存Base64编码结果的图片数量
+            "max_image_dim": 0  # 本地图片长边超过该像素数时缩小后再发送（需安装Pillow），0表示不缩小
         }
 
         if os.path.exists(config_file):
-            with open(config_file, 'r', encoding='utf-8') as f:
-                user_config = yaml.safe_load(f)
-                default_config.update(user_config)
+            user_config = load_yaml_file(config_file)
+            default_config.update(user_config)
         else:
             with open(config_file, 'w', encoding='utf-8') as f:
                 yaml.dump(default_config, f, allow_unicode=True, default_flow_style=False)
@@ -318,8 +551,7 @@ class AIModelProcessor:
         }
 
         if os.path.exists(providers_file):
-            with open(providers_file, 'r', encoding='utf-8') as f:
-                return yaml.safe_load(f)
+            return load_yaml_file(providers_file)
         else:
             with open(providers_file, 'w', encoding='utf-8') as f:
                 yaml.dump(default_providers, f, allow_unicode=True, default_flow_style=False)
@@ -350,29 +582,92 @@ class AIModelProcessor:
         
         return config
     
+    def create_session(self) -> Union[requests.Session, "httpx.Client"]:
+        """
+        创建带连接池的HTTP会话，所有API调用复用同一组keep-alive连接
+        
+        配置 http2: true 且安装了 httpx[http2] 时使用httpx客户端，
+        并发请求在同一条HTTP/2连接上多路复用，减少连接数和TLS握手
+        """
+        max_workers = max(1, int(self.config.get("max_workers", 3)))
+        
+        if self.config.get("http2", False):
+            if HAS_HTTPX:
+                try:
+                    return httpx.Client(
+                        http2=True,
+                        limits=httpx.Limits(max_connections=max_workers * 2, max_keepalive_connections=max_workers),
+                        headers=DEFAULT_HEADERS
+                    )
+                except ImportError:
+                    pass
+            self.logger.warning("⚠️ 未安装 httpx[http2]，http2 不可用，改用requests")
+        
+        # 重试由call_api_*自行控制，这里不让urllib3再重试
+        self._http_adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers * 2, max_retries=0)
+        return self.new_requests_session()
+    
+    def new_requests_session(self) -> requests.Session:
+        """创建挂载共享连接池（self._http_adapter）的requests会话"""
+        session = requests.Session()
+        session.mount("https://", self._http_adapter)
+        session.mount("http://", self._http_adapter)
+        session.headers.update(DEFAULT_HEADERS)
+        return session
+    
+    def get_session(self) -> Union[requests.Session, "httpx.Client"]:
+        """
+        获取当前线程使用的HTTP会话
+        
+        requests每个线程一个Session（不在同一个Session对象上竞争），
+        但都挂载同一个HTTPAdapter，连接池仍然全局共享；httpx客户端本身线程安全，直接共用
+        """
+        if not isinstance(self.session, requests.Session):
+            return self.session
+        
+        local = self._thread_local
+        # create_session 重建连接池后（如 --workers）旧的线程会话随之作废
+        if getattr(local, "adapter", None) is not self._http_adapter:
+            local.session = self.new_requests_session()
+            local.adapter = self._http_adapter
+        return local.session
+    
     def setup_logging(self):
-        """设置日志"""
-        file_handler = logging.FileHandler('ai_processor.log', encoding='utf-8')
-        file_handler.setLevel(logging.INFO)
-        file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        """
+        设置日志
         
-        console_handler = logging.StreamHandler(sys.stdout)
-        console_handler.setLevel(logging.INFO)
-        console_handler.setFormatter(logging.Formatter('%(message)s'))
+        文件和控制台handler放在QueueListener后台线程中执行，
+        工作线程记录日志时只需入队，不会在文件写入上互相等待
+        """
+        log_level = str(self.config.get("log_level", "INFO")).upper()
         
         self.logger = logging.getLogger(__name__)
-        self.logger.setLevel(logging.INFO)
+        self.logger.setLevel(getattr(logging, log_level, logging.INFO))
         # 避免重复添加handler
         if not self.logger.handlers:
-            self.logger.addHandler(file_handler)
-            self.logger.addHandler(console_handler)
+            file_handler = logging.FileHandler('ai_processor.log', encoding='utf-8')
+            file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+            
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(logging.Formatter('%(message)s'))
+            
+            log_queue = queue.SimpleQueue()
+            listener = QueueListener(log_queue, file_handler, console_handler)
+            listener.start()
+            # 退出时写完队列中剩余的日志
+            atexit.register(listener.stop)
+            self.logger.addHandler(QueueHandler(log_queue))
         
         logging.getLogger('urllib3').setLevel(logging.WARNING)
         logging.getLogger('requests').setLevel(logging.WARNING)
+        logging.getLogger('httpx').setLevel(logging.WARNING)
     
     def load_system_prompt(self) -> str:
-        """加载系统提示词"""
+        """加载系统提示词（按文件路径缓存，只读取一次）"""
         prompt_file = self.config["prompt_file"]
+        if prompt_file in self._system_prompt_cache:
+            return self._system_prompt_cache[prompt_file]
+        
         if not os.path.exists(prompt_file):
             self.logger.error(f"❌ 提示词文件不存在: {prompt_file}")
             return ""
@@ -386,50 +681,95 @@ class AIModelProcessor:
             if end > start:
                 content = content[start:end]
         
-        return content.strip()
+        self._system_prompt_cache[prompt_file] = content.strip()
+        return self._system_prompt_cache[prompt_file]
     
-    def check_row_processed(self, df: pd.DataFrame, index: int, response_col: str) -> bool:
-        """检查指定行是否已经处理过"""
+    def prepare_response_column(self, df: pd.DataFrame, response_col: str):
+        """
+        创建或转换响应列为字符串类型
+        
+        全空的响应列会被读成float64，直接写入字符串会失败，这里统一转成RESPONSE_DTYPE
+        """
         if response_col not in df.columns:
-            return False
+            df[response_col] = pd.array([""] * len(df), dtype=RESPONSE_DTYPE)
+        else:
+            df[response_col] = df[response_col].astype(RESPONSE_DTYPE)
+    
+    def get_processed_mask(self, df: pd.DataFrame, response_col: str) -> pd.Series:
+        """向量化计算每行是否已经处理过（响应列非空）"""
+        if response_col not in df.columns:
+            return pd.Series(False, index=df.index)
         
-        response = df.at[index, response_col]
-        return not pd.isna(response) and str(response).strip() != ""
+        responses = df[response_col]
+        if not isinstance(responses.dtype, pd.StringDtype):
+            responses = responses.astype(RESPONSE_DTYPE)
+        # 字符串列上的strip/比较直接在Arrow缓冲区上完成，缺失值视为未处理
+        return (responses.notna() & responses.str.strip().ne("")).fillna(False).astype(bool)
+    
+    def load_image_base64(self, image_path: str, mime_type: str) -> Tuple[str, str]:
+        """
+        读取图片并Base64编码，返回 (Base64数据, MIME类型)
+        
+        按 (路径, 修改时间, 大小) 缓存最近使用的image_cache_size张图片，
+        同一图片被多行引用时只读取和编码一次，文件修改后自动重新编码。
+        配置了max_image_dim时，过大的图片缩小为JPEG，返回的MIME类型随之变为image/jpeg
+        """
+        stat = os.stat(image_path)
+        # 用绝对路径作键，同一图片以相对/绝对路径混合引用时也只编码一次
+        key = (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size)
+        with self.image_cache_lock:
+            image_data = self._image_cache.get(key)
+            if image_data is not None:
+                self._image_cache.move_to_end(key)
+                return image_data
+        
+        image_data = None
+        max_dim = self.config.get("max_image_dim", 0)
+        if max_dim and HAS_PIL:
+            try:
+                resized = downscale_image(image_path, max_dim)
+            except Exception as e:
+                # Pillow无法解析的图片按原样发送
+                self.logger.warning("⚠️ 缩小图片失败，按原图发送: %.50s", e)
+                resized = None
+            if resized is not None:
+                image_data = (b64encode_str(resized), 'image/jpeg')
+        if image_data is None:
+            image_data = (b64encode_file(image_path), mime_type)
+        
+        with self.image_cache_lock:
+            self._image_cache[key] = image_data
+            while len(self._image_cache) > self.config.get("image_cache_size", 64):
+                self._image_cache.popitem(last=False)
+        return image_data
     
     def encode_image_to_base64(self, image_path: str) -> Optional[str]:
         """将本地图片转换为Base64编码的data URL"""
-        if not os.path.exists(image_path):
-            self.logger.error(f"❌ 图片不存在: {image_path}")
-            return None
-        
-        mime_type, _ = mimetypes.guess_type(image_path)
-        supported_types = ['image/jpeg', 'image/png', 'image/gif', 'image/webp']
-        
-        if mime_type not in supported_types:
+        # 先按扩展名判断格式，不支持的图片不必访问文件系统
+        mime_type = guess_image_mime(image_path)
+        if mime_type not in SUPPORTED_IMAGE_TYPES:
             self.logger.error(f"❌ 不支持的图片格式: {mime_type}")
             return None
         
         try:
-            with open(image_path, 'rb') as f:
-                image_data = base64.b64encode(f.read()).decode('utf-8')
+            # load_image_base64内部的os.stat同时完成存在性检查
+            image_data, mime_type = self.load_image_base64(image_path, mime_type)
             return f"data:{mime_type};base64,{image_data}"
+        except FileNotFoundError:
+            self.logger.error(f"❌ 图片不存在: {image_path}")
+            return None
         except Exception as e:
             self.logger.error(f"❌ 读取图片失败: {str(e)}")
             return None
     
     def get_image_base64_raw(self, image_path: str) -> Optional[Tuple[str, str]]:
         """获取图片的原始Base64数据和MIME类型"""
-        if not os.path.exists(image_path):
-            return None
-        
-        mime_type, _ = mimetypes.guess_type(image_path)
+        mime_type = guess_image_mime(image_path)
         if not mime_type:
             return None
         
         try:
-            with open(image_path, 'rb') as f:
-                image_data = base64.b64encode(f.read()).decode('utf-8')
-            return image_data, mime_type
+            return self.load_image_base64(image_path, mime_type)
         except:
             return None
     
@@ -437,12 +777,25 @@ class AIModelProcessor:
         """判断是否为Excel文件"""
         return file_path.lower().endswith(('.xlsx', '.xls', '.xlsm'))
     
-    def load_input_file(self, file_path: str) -> Optional[pd.DataFrame]:
+    def is_parquet_file(self, file_path: str) -> bool:
+        """判断是否为Parquet文件"""
+        return file_path.lower().endswith('.parquet')
+    
+    def get_file_type(self, file_path: str) -> str:
+        """获取用于日志显示的文件类型"""
+        if self.is_excel_file(file_path):
+            return "Excel"
+        if self.is_parquet_file(file_path):
+            return "Parquet"
+        return "CSV"
+    
+    def load_input_file(self, file_path: str, columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
         """
-        加载输入文件（支持CSV和Excel）
+        加载输入文件（支持CSV、Excel和Parquet）
         
         Args:
             file_path: 文件路径
+            columns: 只读取CSV/Parquet中的这些列（不存在的列忽略），None表示读取全部列
             
         Returns:
             DataFrame或None
@@ -458,7 +811,8 @@ class AIModelProcessor:
                     return None
                 
                 self.logger.info(f"📊 正在加载Excel文件: {file_path}")
-                df = pd.read_excel(file_path, engine='openpyxl')
+                # 安装了python-calamine时用它读取数据，比openpyxl快数倍；写回仍使用openpyxl
+                df = pd.read_excel(file_path, engine='calamine' if HAS_CALAMINE else 'openpyxl')
                 
                 # 初始化Excel图片提取器
                 self.excel_image_extractor = ExcelImageExtractor(file_path)
@@ -466,42 +820,157 @@ class AIModelProcessor:
                     self.logger.info(f"🖼️ 从Excel中提取到 {self.excel_image_extractor.get_image_count()} 张嵌入图片")
                 
                 return df
+            elif self.is_parquet_file(file_path):
+                if not HAS_PYARROW:
+                    self.logger.error("❌ 需要安装pyarrow来处理Parquet文件: pip install pyarrow")
+                    return None
+                
+                self.logger.info(f"📊 正在加载Parquet文件: {file_path}")
+                if columns is not None:
+                    # 列裁剪只读取需要的列，无需解析其余数据
+                    header = pyarrow.parquet.read_schema(file_path).names
+                    columns = [col for col in columns if col in header] or header[:1]
+                return pd.read_parquet(file_path, engine='pyarrow', columns=columns)
             else:
                 self.logger.info(f"📊 正在加载CSV文件: {file_path}")
-                return pd.read_csv(file_path)
+                # pyarrow引擎多线程解析，明显快于默认的C引擎
+                read_kwargs = {"engine": "pyarrow"} if HAS_PYARROW else {}
+                if columns is not None:
+                    header = pd.read_csv(file_path, nrows=0).columns
+                    # 至少保留一列，保证行数正确
+                    usecols = [col for col in columns if col in header] or list(header[:1])
+                    read_kwargs["usecols"] = usecols
+                    read_kwargs["dtype"] = {col: "string" for col in usecols}
+                return pd.read_csv(file_path, **read_kwargs)
                 
         except Exception as e:
             self.logger.error(f"❌ 加载文件失败: {str(e)}")
             return None
     
-    def save_output_file(self, df: pd.DataFrame, file_path: str):
+    def save_output_file(self, df: pd.DataFrame, file_path: str) -> bool:
         """
-        保存输出文件（根据原文件格式选择CSV或Excel）
+        保存输出文件（根据原文件格式选择CSV、Excel或Parquet）
         
         Args:
             df: DataFrame
             file_path: 文件路径
+            
+        Returns:
+            是否保存成功
         """
+        # 先写临时文件再原子替换，避免写到一半中断时损坏原文件（保留扩展名以便按格式写入）
+        root, ext = os.path.splitext(file_path)
+        tmp_path = f"{root}.tmp{ext}"
         try:
             if self.is_excel_file(file_path):
                 # 保存为Excel（注意：嵌入的图片会丢失，只保存数据）
-                df.to_excel(file_path, index=False, engine='openpyxl')
+                df.to_excel(tmp_path, index=False, engine='openpyxl')
+            elif self.is_parquet_file(file_path):
+                # 列式压缩存储，长文本响应列的写入远快于CSV
+                df.to_parquet(tmp_path, index=False, engine='pyarrow', compression='zstd')
             else:
-                df.to_csv(file_path, index=False)
+                df.to_csv(tmp_path, index=False)
+            os.replace(tmp_path, file_path)
+            return True
         except Exception as e:
             self.logger.error(f"❌ 保存文件失败: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+    
+    def get_output_file(self, input_file: str) -> str:
+        """
+        获取结果写入的文件
+        
+        默认写回输入文件；CSV输入且output_format为parquet时写到同名的.parquet文件，
+        长文本响应列的写入和之后的读取都远快于CSV
+        """
+        # 未安装pyarrow时无法写Parquet，仍写回输入文件
+        if (self.config.get("output_format", "") == "parquet" and HAS_PYARROW
+                and self.get_file_type(input_file) == "CSV"):
+            return os.path.splitext(input_file)[0] + ".parquet"
+        return input_file
+    
+    def get_working_file(self, input_file: str) -> str:
+        """获取本次运行要读取的文件：单独的输出文件已存在时从中读取（包含之前的结果），否则读取输入文件"""
+        output_file = self.get_output_file(input_file)
+        if output_file != input_file and os.path.exists(output_file):
+            return output_file
+        return input_file
+    
+    def get_response_column(self) -> str:
+        """获取当前模型对应的响应列名（按模型名缓存，--model 覆盖模型后自动对应新列）"""
+        model_name = self.config["model_name"]
+        if model_name not in self._response_columns:
+            model_name_safe = model_name.replace("-", "_").replace(".", "_")
+            self._response_columns[model_name] = f"ai_response_{model_name_safe}"
+        return self._response_columns[model_name]
+    
+    def get_results_file(self, input_file: str) -> str:
+        """获取处理过程中追加写入结果的JSONL文件路径（用于断点续传）"""
+        return f"{input_file}.results.jsonl"
+    
+    def load_results_file(self, input_file: str, response_col: str) -> Dict[int, str]:
+        """
+        读取上次中断时留下的JSONL结果
+        
+        Args:
+            input_file: 输入文件路径
+            response_col: 响应列名，只读取属于该列的结果
+            
+        Returns:
+            {行索引: 响应}，同一行多次写入（如多次中断续传）时以最后一条为准
+        """
+        results_file = self.get_results_file(input_file)
+        responses: Dict[int, str] = {}
+        if not os.path.exists(results_file):
+            return responses
+        
+        with open(results_file, 'rb') as f:
+            for line in f:
+                try:
+                    record = json_loads(line)
+                except ValueError:
+                    # 中断时最后一行可能只写了一半
+                    continue
+                if record.get("column") == response_col:
+                    responses[record.get("index")] = record["response"]
+        
+        return responses
+    
+    def merge_results_file(self, df: pd.DataFrame, input_file: str, response_col: str) -> int:
+        """将上次中断时留下的JSONL结果合并回DataFrame，返回合并的结果条数"""
+        return self.apply_responses(df, response_col, self.load_results_file(input_file, response_col))
+    
+    def apply_responses(self, df: pd.DataFrame, response_col: str, responses: Dict[int, str]) -> int:
+        """将 {行索引: 响应} 一次性写入响应列，忽略不存在的行，返回写入的行数"""
+        # 遍历较小的一侧（分块处理时结果远多于当前块的行数）
+        if len(responses) > len(df):
+            indices = [index for index in df.index if index in responses]
+        else:
+            indices = [index for index in responses if index in df.index]
+        if indices:
+            df.loc[indices, response_col] = [responses[index] for index in indices]
+        
+        return len(indices)
     
-    def get_image_for_row(self, row_index: int, row: pd.Series, image_col: str) -> Optional[str]:
+    def remove_results_file(self, input_file: str):
+        """删除已合并回原文件的JSONL结果文件"""
+        results_file = self.get_results_file(input_file)
+        if os.path.exists(results_file):
+            os.remove(results_file)
+    
+    def get_image_for_row(self, row_index: int, image_value: Any = None) -> Optional[ImageData]:
         """
         获取指定行的图片（支持嵌入图片和文件路径）
         
         Args:
             row_index: DataFrame行索引
-            row: 行数据
-            image_col: 图片列名
+            image_value: 该行图片列的值（没有图片列时为None）
             
         Returns:
-            图片的Base64 data URL，或图片文件路径
+            嵌入图片的 (Base64, MIME类型)，或Base64 data URL、远程图片地址、
+            图片文件路径（已拼接image_base_path）
         """
         image_source = self.config.get("image_source", "auto")
         
@@ -509,46 +978,62 @@ class AIModelProcessor:
         if self.excel_image_extractor and image_source in ("auto", "embedded"):
             # Excel的行号 = DataFrame索引 + 2 (索引从0开始，Excel行号从1开始且有标题行)
             excel_row = row_index + 2
-            base64_image = self.excel_image_extractor.get_image_base64(excel_row)
-            if base64_image:
-                return base64_image
+            # 直接使用提取时保存的 (Base64, MIME类型)，需要data URL的Provider再自行拼接
+            embedded_image = self.excel_image_extractor.get_image_base64_raw(excel_row)
+            if embedded_image:
+                return embedded_image
         
         # 检查是否有文件路径
-        if image_col and image_col in row.index:
-            img_value = row.get(image_col, "")
-            if pd.notna(img_value) and str(img_value).strip():
-                img_path = str(img_value).strip()
-                # 如果是完整的data URL，直接返回
-                if img_path.startswith("data:"):
-                    return img_path
-                # 否则作为文件路径处理
+        if pd.notna(image_value) and str(image_value).strip():
+            img_path = str(image_value).strip()
+            # 完整的data URL或http(s)地址直接返回，由各Provider按需引用
+            if img_path.startswith("data:") or is_image_url(img_path):
                 return img_path
+            # 否则作为文件路径处理，相对路径在扫描时一次性拼上image_base_path，
+            # 构建请求和计算缓存键时直接使用
+            image_base_path = self.config.get("image_base_path", "")
+            if image_base_path and not os.path.isabs(img_path):
+                img_path = os.path.join(image_base_path, img_path)
+            return img_path
         
         return None
     
-    def build_user_message_openai(self, text: str, image_data: str = None) -> Union[str, List]:
+    def get_image_payload(self, image_data: ImageData) -> Optional[Tuple[str, str]]:
+        """
+        获取需要内联发送的图片的 (Base64数据, MIME类型)
+        
+        嵌入图片已是该形式，直接返回；data URL只拆分不重新编码；文件路径读取并编码（有缓存）
+        """
+        if isinstance(image_data, tuple):
+            return image_data
+        if image_data.startswith("data:"):
+            return split_data_url(image_data)
+        return self.get_image_base64_raw(image_data)
+    
+    def build_user_message_openai(self, text: str, image_data: ImageData = None) -> Union[str, List]:
         """
         构建OpenAI格式的用户消息
         
         Args:
             text: 用户文本
             image_data: 图片数据，可以是:
+                - Excel嵌入图片的 (Base64, MIME类型)
                 - Base64 data URL (data:image/xxx;base64,...)
+                - 远程图片地址 (http(s)://...)
                 - 本地文件路径
         """
         if not image_data:
             return text
         
-        # 判断是data URL还是文件路径
-        if image_data.startswith("data:"):
-            # 已经是Base64 data URL
+        # 判断是嵌入图片、data URL、远程地址还是文件路径
+        if isinstance(image_data, tuple):
+            base64_data, mime_type = image_data
+            image_url = f"data:{mime_type};base64,{base64_data}"
+        elif image_data.startswith("data:") or is_image_url(image_data):
+            # 已经是Base64 data URL，或由服务端自行下载的图片地址，不必在本地编码
             image_url = image_data
         else:
             # 是文件路径，需要转换
-            image_base_path = self.config.get("image_base_path", "")
-            if image_base_path and not os.path.isabs(image_data):
-                image_data = os.path.join(image_base_path, image_data)
-            
             image_url = self.encode_image_to_base64(image_data)
             if not image_url:
                 return text
@@ -567,41 +1052,33 @@ class AIModelProcessor:
         
         return content
     
-    def build_user_message_anthropic(self, text: str, image_data: str = None) -> List:
+    def build_user_message_anthropic(self, text: str, image_data: ImageData = None) -> List:
         """
         构建Anthropic格式的用户消息
         
         Args:
             text: 用户文本
             image_data: 图片数据，可以是:
+                - Excel嵌入图片的 (Base64, MIME类型)
                 - Base64 data URL (data:image/xxx;base64,...)
+                - 远程图片地址 (http(s)://...)
                 - 本地文件路径
         """
         content = []
         
         if image_data:
-            # 判断是data URL还是文件路径
-            if image_data.startswith("data:"):
-                # 解析data URL
-                match = re.match(r'data:([^;]+);base64,(.+)', image_data)
-                if match:
-                    mime_type = match.group(1)
-                    base64_data = match.group(2)
-                    content.append({
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": mime_type,
-                            "data": base64_data
-                        }
-                    })
+            # 判断是远程地址还是需要内联的图片数据
+            if isinstance(image_data, str) and is_image_url(image_data):
+                # 按地址引用，服务端自行下载，请求体不含图片数据
+                content.append({
+                    "type": "image",
+                    "source": {
+                        "type": "url",
+                        "url": image_data
+                    }
+                })
             else:
-                # 是文件路径
-                image_base_path = self.config.get("image_base_path", "")
-                if image_base_path and not os.path.isabs(image_data):
-                    image_data = os.path.join(image_base_path, image_data)
-                
-                result = self.get_image_base64_raw(image_data)
+                result = self.get_image_payload(image_data)
                 if result:
                     base64_data, mime_type = result
                     content.append({
@@ -618,118 +1095,239 @@ class AIModelProcessor:
         
         return content if content else [{"type": "text", "text": text or ""}]
     
-    def call_api_openai(self, user_prompt: str, system_prompt: str, image_path: str = None) -> Optional[str]:
-        """调用OpenAI兼容格式的API"""
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.provider_config['api_key']}"
-        }
+    def get_retry_delay(self, attempt: int, response: Optional[Any] = None) -> Optional[float]:
+        """
+        计算第attempt次失败后的等待时间（见compute_retry_delay）
         
-        user_content = self.build_user_message_openai(user_prompt, image_path)
+        服务端要求的Retry-After超过retry_after_cap秒时返回None，调用方放弃该请求
+        """
+        retry_after = parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+        delay = compute_retry_delay(self.provider_config, attempt, retry_after)
+        if delay is None:
+            self.logger.error(f"❌ 服务端要求 {retry_after:.0f} 秒后重试，超过retry_after_cap，放弃该请求")
+        return delay
+    
+    def get_circuit_wait(self) -> float:
+        """熔断器打开时返回距冷却结束的秒数，关闭时返回0"""
+        with self.breaker_lock:
+            return max(0.0, self._breaker["open_until"] - time.monotonic())
+    
+    def wait_for_circuit(self):
+        """熔断器打开时等到冷却结束再发请求，期间不访问网络；待处理的行延后发送而不是直接放弃"""
+        wait = self.get_circuit_wait()
+        while wait > 0:
+            time.sleep(wait)
+            # 等待期间其他线程的探测请求可能再次打开熔断器
+            wait = self.get_circuit_wait()
+    
+    async def wait_for_circuit_async(self):
+        """wait_for_circuit的异步版本"""
+        wait = self.get_circuit_wait()
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self.get_circuit_wait()
+    
+    def record_api_failure(self):
+        """记录一次可重试的失败，连续失败达到阈值时打开熔断器"""
+        threshold = self.config.get("circuit_breaker_threshold", 10)
+        if not threshold:
+            return
         
-        data = {
-            "model": self.config["model_name"],
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_content}
-            ],
-            "temperature": self.config.get("temperature", 0.6)
-        }
+        with self.breaker_lock:
+            self._breaker["fails"] += 1
+            if self._breaker["fails"] < threshold:
+                return
+            cooldown = self.config.get("circuit_breaker_cooldown", 60)
+            self._breaker["fails"] = 0
+            self._breaker["open_until"] = time.monotonic() + cooldown
+        
+        self.logger.warning(f"⚠️ API连续失败 {threshold} 次，暂停请求 {cooldown} 秒")
+    
+    def record_api_success(self):
+        """请求成功后清零连续失败计数"""
+        with self.breaker_lock:
+            self._breaker["fails"] = 0
+    
+    def encode_request_body(self, data: Dict[str, Any],
+                            headers: Optional[Dict[str, str]]) -> Tuple[bytes, Optional[Dict[str, str]]]:
+        """
+        序列化请求体，配置 gzip_requests: true 时压缩较大的请求体
         
-        if "max_tokens" in self.config:
-            data["max_tokens"] = self.config["max_tokens"]
+        Returns:
+            (请求体, 请求头)，压缩时返回加了Content-Encoding的请求头副本，不修改共享的请求模板
+        """
+        body = json_dumps(data)
+        if self.config.get("gzip_requests", False) and len(body) > GZIP_MIN_BODY_SIZE:
+            # 压缩级别1: Base64图片数据主要靠熵编码压缩，更高级别收益很小但慢得多
+            body = gzip.compress(body, compresslevel=1)
+            headers = {**(headers or {}), "Content-Encoding": "gzip"}
+        return body, headers
+    
+    def post_with_retry(self, url: str, data: Dict[str, Any],
+                        headers: Optional[Dict[str, str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        发送POST请求，对网络错误、429和5xx进行重试
         
+        Returns:
+            状态码200时的响应JSON，失败返回None
+        """
         max_retries = self.provider_config.get("max_retries", 3)
-        retry_delay = self.provider_config.get("retry_delay", 1)
+        timeout = self.provider_config.get("timeout", 60)
+        # 请求体只序列化一次（需要时压缩），重试时直接复用
+        body, headers = self.encode_request_body(data, headers)
         
         for attempt in range(max_retries):
+            self.wait_for_circuit()
+            
+            response = None
             try:
-                response = requests.post(
-                    self.provider_config["api_url"],
-                    headers=headers,
-                    json=data,
-                    timeout=self.provider_config.get("timeout", 60)
-                )
+                session = self.get_session()
+                if HAS_HTTPX and isinstance(session, httpx.Client):
+                    response = session.post(url, headers=headers, content=body, timeout=timeout)
+                else:
+                    response = session.post(url, headers=headers, data=body, timeout=timeout)
                 
                 if response.status_code == 200:
-                    result = response.json()
-                    if "choices" in result and len(result["choices"]) > 0:
-                        return result["choices"][0]["message"]["content"]
-                else:
-                    self.logger.error(f"❌ API调用失败 (状态码: {response.status_code})")
+                    # 直接解析解压后的字节，省去先解码成str
+                    result = json_loads(response.content)
+                    self.record_api_success()
+                    return result
                 
-            except requests.exceptions.RequestException as e:
+                self.logger.error("❌ API调用失败 (状态码: %s)", response.status_code)
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    return None
+                self.record_api_failure()
+                
+            except HTTP_ERRORS as e:
+                self.record_api_failure()
                 if attempt == max_retries - 1:
-                    self.logger.error(f"❌ API调用失败: {str(e)[:50]}...")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay * (attempt + 1))
+                    self.logger.error("❌ API调用失败: %.50s...", e)
+            
+            if attempt < max_retries - 1:
+                delay = self.get_retry_delay(attempt, response)
+                if delay is None:
+                    return None
+                time.sleep(delay)
         
         return None
     
-    def call_api_anthropic(self, user_prompt: str, system_prompt: str, image_path: str = None) -> Optional[str]:
-        """调用Anthropic Claude API"""
-        headers = {
-            "Content-Type": "application/json",
-            "x-api-key": self.provider_config['api_key'],
-            "anthropic-version": self.provider_config.get("api_version", "2023-06-01")
-        }
+    def get_request_template(self, system_prompt: str) -> Tuple[str, Dict[str, Any], Dict[str, str]]:
+        """
+        获取请求中与行无关的部分 (url, data, headers)，按系统提示词缓存
         
-        user_content = self.build_user_message_anthropic(user_prompt, image_path)
+        模型、温度、请求头和系统消息在一次运行中不变，只构建一次；
+        模板会被多个线程共享，使用方只能浅拷贝后添加用户内容，不能修改
+        """
+        template = self._request_templates.get(system_prompt)
+        if template is not None:
+            return template
+        
+        config = self.config
+        provider_config = self.provider_config
+        api_type = provider_config.get("api_type", "openai")
+        
+        if api_type == "anthropic":
+            url = provider_config["api_url"]
+            headers = {
+                "x-api-key": provider_config['api_key'],
+                "anthropic-version": provider_config.get("api_version", "2023-06-01")
+            }
+            data = {
+                "model": config["model_name"],
+                "max_tokens": config.get("max_tokens", 4096),
+                "system": system_prompt,
+                "messages": []
+            }
+            if "temperature" in config:
+                data["temperature"] = config["temperature"]
+        elif api_type == "google":
+            model_name = config["model_name"]
+            api_key = provider_config['api_key']
+            base_url = provider_config["api_url"]
+            url = f"{base_url}/models/{model_name}:generateContent?key={api_key}"
+            headers = {}
+            data = {
+                "contents": [],
+                "generationConfig": {
+                    "temperature": config.get("temperature", 0.6),
+                    "maxOutputTokens": config.get("max_tokens", 2048)
+                }
+            }
+        else:
+            url = provider_config["api_url"]
+            headers = {
+                "Authorization": f"Bearer {provider_config['api_key']}"
+            }
+            data = {
+                "model": config["model_name"],
+                "messages": [
+                    {"role": "system", "content": system_prompt}
+                ],
+                "temperature": config.get("temperature", 0.6)
+            }
+            if "max_tokens" in config:
+                data["max_tokens"] = config["max_tokens"]
         
-        data = {
-            "model": self.config["model_name"],
-            "max_tokens": self.config.get("max_tokens", 4096),
-            "system": system_prompt,
-            "messages": [
-                {"role": "user", "content": user_content}
-            ]
-        }
+        template = (url, data, headers)
+        self._request_templates[system_prompt] = template
+        return template
+    
+    def build_request_openai(self, user_prompt: str, system_prompt: str,
+                             image_path: ImageData = None) -> Tuple[str, Dict[str, Any], Dict[str, str]]:
+        """构建OpenAI兼容格式的请求，返回 (url, data, headers)"""
+        url, template, headers = self.get_request_template(system_prompt)
         
-        if "temperature" in self.config:
-            data["temperature"] = self.config["temperature"]
+        user_content = self.build_user_message_openai(user_prompt, image_path)
         
-        max_retries = self.provider_config.get("max_retries", 3)
-        retry_delay = self.provider_config.get("retry_delay", 2)
+        data = dict(template)
+        data["messages"] = template["messages"] + [{"role": "user", "content": user_content}]
+        return url, data, headers
+    
+    def extract_content_openai(self, result: Optional[Dict[str, Any]]) -> Optional[str]:
+        """从OpenAI兼容格式的响应中取出文本"""
+        if result and "choices" in result and len(result["choices"]) > 0:
+            return result["choices"][0]["message"]["content"]
+        return None
+    
+    def call_api_openai(self, user_prompt: str, system_prompt: str, image_path: ImageData = None) -> Optional[str]:
+        """调用OpenAI兼容格式的API"""
+        url, data, headers = self.build_request_openai(user_prompt, system_prompt, image_path)
+        return self.extract_content_openai(self.post_with_retry(url, data, headers))
+    
+    def build_request_anthropic(self, user_prompt: str, system_prompt: str,
+                                image_path: ImageData = None) -> Tuple[str, Dict[str, Any], Dict[str, str]]:
+        """构建Anthropic Claude格式的请求，返回 (url, data, headers)"""
+        url, template, headers = self.get_request_template(system_prompt)
         
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(
-                    self.provider_config["api_url"],
-                    headers=headers,
-                    json=data,
-                    timeout=self.provider_config.get("timeout", 60)
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if "content" in result and len(result["content"]) > 0:
-                        return result["content"][0]["text"]
-                else:
-                    self.logger.error(f"❌ API调用失败 (状态码: {response.status_code})")
-                
-            except requests.exceptions.RequestException as e:
-                if attempt == max_retries - 1:
-                    self.logger.error(f"❌ API调用失败: {str(e)[:50]}...")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay * (attempt + 1))
+        user_content = self.build_user_message_anthropic(user_prompt, image_path)
         
+        data = dict(template)
+        data["messages"] = [{"role": "user", "content": user_content}]
+        return url, data, headers
+    
+    def extract_content_anthropic(self, result: Optional[Dict[str, Any]]) -> Optional[str]:
+        """从Anthropic格式的响应中取出文本"""
+        if result and "content" in result and len(result["content"]) > 0:
+            return result["content"][0]["text"]
         return None
     
-    def call_api_google(self, user_prompt: str, system_prompt: str, image_data: str = None) -> Optional[str]:
+    def call_api_anthropic(self, user_prompt: str, system_prompt: str, image_path: ImageData = None) -> Optional[str]:
+        """调用Anthropic Claude API"""
+        url, data, headers = self.build_request_anthropic(user_prompt, system_prompt, image_path)
+        return self.extract_content_anthropic(self.post_with_retry(url, data, headers))
+    
+    def build_request_google(self, user_prompt: str, system_prompt: str,
+                             image_data: ImageData = None) -> Tuple[str, Dict[str, Any], Dict[str, str]]:
         """
-        调用Google Gemini API
+        构建Google Gemini格式的请求，返回 (url, data, headers)
         
         Args:
             user_prompt: 用户提示词
             system_prompt: 系统提示词
-            image_data: 图片数据，可以是Base64 data URL或文件路径
+            image_data: 图片数据，可以是嵌入图片的 (Base64, MIME类型)、Base64 data URL或文件路径
+                （Gemini不支持按http(s)地址引用图片）
         """
-        model_name = self.config["model_name"]
-        api_key = self.provider_config['api_key']
-        base_url = self.provider_config["api_url"]
-        url = f"{base_url}/models/{model_name}:generateContent?key={api_key}"
-        
-        headers = {"Content-Type": "application/json"}
+        url, template, headers = self.get_request_template(system_prompt)
         
         # 构建内容
         parts = []
@@ -742,26 +1340,10 @@ class AIModelProcessor:
         
         # 添加图片
         if image_data:
-            # 判断是data URL还是文件路径
-            if image_data.startswith("data:"):
-                # 解析data URL
-                match = re.match(r'data:([^;]+);base64,(.+)', image_data)
-                if match:
-                    mime_type = match.group(1)
-                    base64_data = match.group(2)
-                    parts.append({
-                        "inline_data": {
-                            "mime_type": mime_type,
-                            "data": base64_data
-                        }
-                    })
+            if isinstance(image_data, str) and is_image_url(image_data):
+                self.logger.warning(f"⚠️ Gemini接口不支持图片地址，已忽略: {image_data}")
             else:
-                # 是文件路径
-                image_base_path = self.config.get("image_base_path", "")
-                if image_base_path and not os.path.isabs(image_data):
-                    image_data = os.path.join(image_base_path, image_data)
-                
-                result = self.get_image_base64_raw(image_data)
+                result = self.get_image_payload(image_data)
                 if result:
                     base64_data, mime_type = result
                     parts.append({
@@ -771,138 +1353,497 @@ class AIModelProcessor:
                         }
                     })
         
-        data = {
-            "contents": [{"parts": parts}],
-            "generationConfig": {
-                "temperature": self.config.get("temperature", 0.6),
-                "maxOutputTokens": self.config.get("max_tokens", 2048)
-            }
-        }
+        data = dict(template)
+        data["contents"] = [{"parts": parts}]
+        return url, data, headers
+    
+    def extract_content_google(self, result: Optional[Dict[str, Any]]) -> Optional[str]:
+        """从Gemini格式的响应中取出文本"""
+        if result and "candidates" in result and len(result["candidates"]) > 0:
+            candidate = result["candidates"][0]
+            if "content" in candidate and "parts" in candidate["content"]:
+                return candidate["content"]["parts"][0]["text"]
+        return None
+    
+    def call_api_google(self, user_prompt: str, system_prompt: str, image_data: ImageData = None) -> Optional[str]:
+        """调用Google Gemini API"""
+        url, data, headers = self.build_request_google(user_prompt, system_prompt, image_data)
+        return self.extract_content_google(self.post_with_retry(url, data, headers))
+    
+    def get_api_handlers(self) -> Optional[Tuple[Callable, Callable]]:
+        """
+        根据api_type获取 (请求构建函数, 响应提取函数)，首次调用后缓存
         
+        Returns:
+            不支持的API类型返回None
+        """
+        if self._api_handlers is None:
+            api_type = self.provider_config.get("api_type", "openai")
+            handlers = {
+                "openai": (self.build_request_openai, self.extract_content_openai),
+                "anthropic": (self.build_request_anthropic, self.extract_content_anthropic),
+                "google": (self.build_request_google, self.extract_content_google),
+            }.get(api_type)
+            if handlers is None:
+                self.logger.error(f"❌ 不支持的API类型: {api_type}")
+                return None
+            self._api_handlers = handlers
+        return self._api_handlers
+    
+    def call_ai_api(self, user_prompt: str, system_prompt: str, image_path: ImageData = None) -> Optional[Dict[str, Any]]:
+        """统一的API调用入口，根据api_type选择调用方式"""
+        handlers = self.get_api_handlers()
+        if handlers is None:
+            return None
+        build_request, extract_content = handlers
+        
+        url, data, headers = build_request(user_prompt, system_prompt, image_path)
+        content = extract_content(self.post_with_retry(url, data, headers))
+        
+        if content:
+            return self.parse_ai_response(content)
+        return None
+    
+    async def post_with_retry_async(self, session: AsyncSession, url: str, data: Dict[str, Any],
+                                    headers: Optional[Dict[str, str]] = None) -> Optional[Dict[str, Any]]:
+        """post_with_retry的异步版本（aiohttp或httpx），重试与熔断规则相同"""
         max_retries = self.provider_config.get("max_retries", 3)
-        retry_delay = self.provider_config.get("retry_delay", 2)
+        body, headers = self.encode_request_body(data, headers)
         
         for attempt in range(max_retries):
+            await self.wait_for_circuit_async()
+            
+            retry_response = None
             try:
-                response = requests.post(
-                    url,
-                    headers=headers,
-                    json=data,
-                    timeout=self.provider_config.get("timeout", 60)
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if "candidates" in result and len(result["candidates"]) > 0:
-                        candidate = result["candidates"][0]
-                        if "content" in candidate and "parts" in candidate["content"]:
-                            return candidate["content"]["parts"][0]["text"]
+                if HAS_HTTPX and isinstance(session, httpx.AsyncClient):
+                    response = await session.post(url, headers=headers, content=body)
+                    status, content = response.status_code, response.content
                 else:
-                    self.logger.error(f"❌ API调用失败 (状态码: {response.status_code})")
+                    async with session.post(url, headers=headers, data=body) as response:
+                        status = response.status
+                        content = await response.read() if status == 200 else None
+                
+                if status == 200:
+                    result = json_loads(content)
+                    self.record_api_success()
+                    return result
                 
-            except requests.exceptions.RequestException as e:
+                self.logger.error("❌ API调用失败 (状态码: %s)", status)
+                if status not in RETRYABLE_STATUS_CODES:
+                    return None
+                self.record_api_failure()
+                retry_response = response
+                    
+            except ASYNC_HTTP_ERRORS as e:
+                self.record_api_failure()
                 if attempt == max_retries - 1:
-                    self.logger.error(f"❌ API调用失败: {str(e)[:50]}...")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay * (attempt + 1))
+                    self.logger.error("❌ API调用失败: %.50s...", e)
+            
+            if attempt < max_retries - 1:
+                delay = self.get_retry_delay(attempt, retry_response)
+                if delay is None:
+                    return None
+                await asyncio.sleep(delay)
         
         return None
     
-    def call_ai_api(self, user_prompt: str, system_prompt: str, image_path: str = None) -> Optional[Dict[str, Any]]:
-        """统一的API调用入口，根据api_type选择调用方式"""
-        api_type = self.provider_config.get("api_type", "openai")
+    async def call_ai_api_async(self, session: AsyncSession, user_prompt: str, system_prompt: str,
+                                image_path: ImageData = None) -> Optional[Dict[str, Any]]:
+        """call_ai_api的异步版本，复用各Provider的请求构建和响应解析"""
+        handlers = self.get_api_handlers()
+        if handlers is None:
+            return None
+        build_request, extract_content = handlers
         
-        if api_type == "openai":
-            content = self.call_api_openai(user_prompt, system_prompt, image_path)
-        elif api_type == "anthropic":
-            content = self.call_api_anthropic(user_prompt, system_prompt, image_path)
-        elif api_type == "google":
-            content = self.call_api_google(user_prompt, system_prompt, image_path)
+        if image_path and isinstance(image_path, str) and not (image_path.startswith("data:") or is_image_url(image_path)):
+            # 本地图片的读取和Base64编码放到线程池执行，避免阻塞事件循环中其他请求的收发
+            url, data, headers = await asyncio.to_thread(build_request, user_prompt, system_prompt, image_path)
         else:
-            self.logger.error(f"❌ 不支持的API类型: {api_type}")
-            return None
+            url, data, headers = build_request(user_prompt, system_prompt, image_path)
+        content = extract_content(await self.post_with_retry_async(session, url, data, headers))
         
         if content:
             return self.parse_ai_response(content)
         return None
     
     def parse_ai_response(self, content: str) -> Optional[Dict[str, Any]]:
-        """解析AI返回的JSON内容"""
+        """解析AI返回的JSON内容，只接受解析结果为对象的片段，都失败时记录第一个解析错误"""
+        result, error = parse_json_object(content)
+        if result is not None:
+            return result
+        
+        if error:
+            self.logger.error("❌ JSON解析错误: %.30s...", error)
+        else:
+            self.logger.error("❌ 无法解析AI响应为JSON")
+        return None
+    
+    def record_row_result(self, responses: Dict[int, str], indices: List[int], response_col: str,
+                          result: Dict[str, Any]):
+        """
+        记录一组行的结果并追加到结果文件
+        
+        只在主线程（或事件循环）中调用，工作线程不直接修改DataFrame，
+        全部结果最后通过apply_responses一次性写回
+        """
+        # 直接保存完整的 AI 响应（JSON 格式）
+        full_response = json.dumps(result, ensure_ascii=False)
+        for index in indices:
+            responses[index] = full_response
+            # 追加一行到结果文件，中断后可据此续传，无需反复重写整个文件
+            if self._results_fh:
+                record = {"index": int(index), "column": response_col, "response": full_response}
+                self._results_fh.write(json_dumps(record) + b"\n")
+        # 限制flush频率，结果密集时避免每条都触发系统调用；文件关闭时会写出剩余缓冲
+        if self._results_fh and time.monotonic() - self._results_flushed_at >= RESULTS_FLUSH_INTERVAL:
+            self._results_fh.flush()
+            self._results_flushed_at = time.monotonic()
+    
+    def group_duplicate_rows(self, rows_to_process: List[Tuple]) -> List[Tuple[List[int], str, Any]]:
+        """按 (用户提示词, 图片) 合并重复行，每组只请求一次API，返回 [(行索引列表, 提示词, 图片)]"""
+        if not self.config.get("dedupe_prompts", True):
+            return [([index], user_prompt, image_data) for index, user_prompt, image_data in rows_to_process]
+        
+        groups: Dict[Tuple[str, Any], List[int]] = {}
+        for index, user_prompt, image_data in rows_to_process:
+            groups.setdefault((user_prompt, image_data), []).append(index)
+        return [(indices, user_prompt, image_data) for (user_prompt, image_data), indices in groups.items()]
+    
+    def get_cache_key(self, user_prompt: str, system_prompt: str, image_data: ImageData = None) -> str:
+        """
+        计算请求的缓存键：模型参数 + 提示词 + 图片
+        
+        图片为文件路径时用 (绝对路径, 修改时间, 大小) 标识，文件更新后缓存自动失效
+        """
+        if isinstance(image_data, tuple):
+            # 嵌入图片按data URL的内容分段哈希，与之前拼出data URL计算的缓存键一致
+            base64_data, mime_type = image_data
+            image_parts = (f"data:{mime_type};base64,", base64_data)
+        else:
+            image_key = image_data or ""
+            if image_data and not (image_data.startswith("data:") or is_image_url(image_data)):
+                try:
+                    stat = os.stat(image_data)
+                    image_key = f"{os.path.abspath(image_data)}:{stat.st_mtime_ns}:{stat.st_size}"
+                except OSError:
+                    pass
+            image_parts = (image_key,)
+        
+        parts = [
+            self.config.get("provider", ""),
+            self.config["model_name"],
+            str(self.config.get("temperature", "")),
+            str(self.config.get("max_tokens", "")),
+            system_prompt,
+            user_prompt,
+            "",  # 与图片部分之间的分隔符
+        ]
+        digest = hashlib.sha256("\x00".join(parts).encode("utf-8"))
+        for part in image_parts:
+            for pos in range(0, len(part), CACHE_KEY_HASH_CHUNK):
+                digest.update(part[pos:pos + CACHE_KEY_HASH_CHUNK].encode("utf-8"))
+        return digest.hexdigest()
+    
+    def lookup_response_cache(self, user_prompt: str, system_prompt: str,
+                              image_data: ImageData = None) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """计算缓存键并查询响应缓存，返回 (缓存键, 缓存的结果或None)"""
+        cache_key = self.get_cache_key(user_prompt, system_prompt, image_data)
+        return cache_key, self.response_cache.get(cache_key)
+    
+    def process_single_row(self, user_prompt: str, system_prompt: str,
+                          image_path: ImageData = None) -> Optional[Dict[str, Any]]:
+        """处理单个请求（线程安全），返回解析后的结果"""
         try:
-            if content.strip().startswith('{') and content.strip().endswith('}'):
-                return json.loads(content)
-            
-            if '```json' in content:
-                start = content.find('```json') + 7
-                end = content.find('```', start)
-                if end > start:
-                    json_content = content[start:end].strip()
-                    return json.loads(json_content)
-            
-            start = content.find('{')
-            end = content.rfind('}') + 1
-            if start >= 0 and end > start:
-                json_content = content[start:end]
-                return json.loads(json_content)
+            if self.response_cache:
+                cache_key, cached = self.lookup_response_cache(user_prompt, system_prompt, image_path)
+                if cached is not None:
+                    return cached
             
-            self.logger.error(f"❌ 无法解析AI响应为JSON")
-            return None
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            result = self.call_ai_api(user_prompt, system_prompt, image_path)
             
-        except json.JSONDecodeError as e:
-            self.logger.error(f"❌ JSON解析错误: {str(e)[:30]}...")
+            if result and self.response_cache:
+                self.response_cache.set(cache_key, result)
+            return result
+        except Exception as e:
             return None
     
-    def process_single_row(self, index: int, user_prompt: str, system_prompt: str,
-                          df: pd.DataFrame, response_col: str,
-                          image_path: str = None) -> bool:
-        """处理单行数据（线程安全）"""
+    async def process_single_row_async(self, session: AsyncSession, semaphore: "asyncio.Semaphore",
+                                       user_prompt: str, system_prompt: str,
+                                       image_path: ImageData = None) -> Optional[Dict[str, Any]]:
+        """处理单个请求（异步），semaphore限制同时在途的请求数"""
         try:
-            time.sleep(self.config.get("request_delay", 0.5))
-
-            result = self.call_ai_api(user_prompt, system_prompt, image_path)
-
-            if result:
-                # 直接保存完整的 AI 响应（JSON 格式）
-                full_response = json.dumps(result, ensure_ascii=False)
-                with self.csv_lock:
-                    df.at[index, response_col] = full_response
-                return True
-            else:
-                return False
-
+            if self.response_cache:
+                # sqlite读写和图片哈希都是阻塞操作，放到线程池执行，不阻塞事件循环
+                cache_key, cached = await asyncio.to_thread(
+                    self.lookup_response_cache, user_prompt, system_prompt, image_path
+                )
+                if cached is not None:
+                    return cached
+            
+            async with semaphore:
+                if self.rate_limiter:
+                    await self.rate_limiter.acquire_async()
+                result = await self.call_ai_api_async(session, user_prompt, system_prompt, image_path)
+            
+            if result and self.response_cache:
+                await asyncio.to_thread(self.response_cache.set, cache_key, result)
+            return result
         except Exception as e:
-            return False
+            return None
+    
+    def process_rows_threaded(self, rows_to_process: List[Tuple], system_prompt: str,
+                              response_col: str, max_workers: int) -> Dict[int, str]:
+        """使用线程池处理待处理行，返回 {行索引: 响应}"""
+        responses: Dict[int, str] = {}
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            with tqdm(total=len(rows_to_process), desc="📊 处理进度", 
+                     bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]",
+                     ncols=80) as pbar:
+                future_to_indices = {}
+                for indices, user_prompt, image_data in rows_to_process:
+                    future = executor.submit(
+                        self.process_single_row, 
+                        user_prompt, system_prompt, 
+                        image_data
+                    )
+                    future_to_indices[future] = indices
+                
+                try:
+                    for future in as_completed(future_to_indices):
+                        try:
+                            result = future.result()
+                            if result:
+                                self.record_row_result(responses, future_to_indices[future], response_col, result)
+                        except Exception as e:
+                            pass
+                        pbar.update(1)
+                except KeyboardInterrupt:
+                    # 取消尚未开始的请求，否则退出线程池时仍会等它们全部跑完
+                    for future in future_to_indices:
+                        future.cancel()
+                    raise
+        
+        return responses
+    
+    def create_async_session(self, concurrency: int) -> AsyncSession:
+        """
+        创建异步模式的HTTP会话
+        
+        配置 http2: true 且安装了 httpx[http2] 时使用httpx异步客户端，
+        所有协程的请求在同一条HTTP/2连接上多路复用；否则使用aiohttp
+        """
+        timeout = self.provider_config.get("timeout", 60)
+        if self.config.get("http2", False) and HAS_HTTPX:
+            try:
+                return httpx.AsyncClient(
+                    http2=True,
+                    limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+                    timeout=timeout,
+                    headers=DEFAULT_HEADERS
+                )
+            except ImportError:
+                if not HAS_AIOHTTP:
+                    raise
+                self.logger.warning("⚠️ 未安装 httpx[http2]，http2 不可用，改用aiohttp")
+        
+        connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency, ttl_dns_cache=300)
+        return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout),
+                                     headers=DEFAULT_HEADERS)
+    
+    async def process_rows_async(self, rows_to_process: List[Tuple], system_prompt: str,
+                                 response_col: str, concurrency: int) -> Dict[int, str]:
+        """使用asyncio处理待处理行，concurrency为同时在途的请求上限，返回 {行索引: 响应}"""
+        responses: Dict[int, str] = {}
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async with self.create_async_session(concurrency) as session:
+            task_to_indices = {}
+            for indices, user_prompt, image_data in rows_to_process:
+                task = asyncio.ensure_future(self.process_single_row_async(
+                    session, semaphore,
+                    user_prompt, system_prompt,
+                    image_data
+                ))
+                task_to_indices[task] = indices
+            
+            with tqdm(total=len(task_to_indices), desc="📊 处理进度", 
+                     bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]",
+                     ncols=80) as pbar:
+                pending = set(task_to_indices)
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        result = task.result()
+                        if result:
+                            self.record_row_result(responses, task_to_indices[task], response_col, result)
+                        pbar.update(1)
+        
+        return responses
     
     def process_csv(self) -> bool:
         """处理CSV文件（向后兼容）"""
         return self.process_file()
     
-    def process_file(self) -> bool:
-        """处理输入文件（支持CSV和Excel）"""
-        # 优先使用input_file，向后兼容csv_input_file
-        input_file = self.config.get("input_file") or self.config.get("csv_input_file")
+    def is_fully_processed(self, input_file: str, response_col: str) -> bool:
+        """
+        只读取响应列快速判断文件是否已全部处理完成
         
-        if not input_file:
-            self.logger.error("❌ 未配置输入文件")
+        仅用于CSV/Parquet（可以按列读取）且没有待合并的结果文件时，
+        重复运行已完成的任务不必加载整张表
+        """
+        if self.is_excel_file(input_file) or os.path.exists(self.get_results_file(input_file)):
             return False
         
-        # 加载文件
-        df = self.load_input_file(input_file)
-        if df is None:
+        working_file = self.get_working_file(input_file)
+        if not os.path.exists(working_file):
+            return False
+        
+        # 先只读表头，第一次处理（还没有响应列）时不必再读数据
+        if self.is_parquet_file(working_file):
+            if not HAS_PYARROW:
+                return False
+            header = pyarrow.parquet.read_schema(working_file).names
+        else:
+            header = pd.read_csv(working_file, nrows=0).columns
+        if response_col not in header:
+            return False
+        
+        df = self.load_input_file(working_file, columns=[response_col])
+        if df is None or response_col not in df.columns:
             return False
+        return bool(self.get_processed_mask(df, response_col).all())
+    
+    def collect_pending_rows(self, df: pd.DataFrame, response_col: str) -> Tuple[List[Tuple], int]:
+        """
+        扫描DataFrame中尚未处理的行
         
+        Returns:
+            ([(行索引, 用户提示词, 图片数据)], 已处理行数)
+        """
         user_prompt_col = self.config["user_prompt_column"]
+        image_col = self.config.get("image_column", "")
+        
+        # 一次性计算已处理掩码，只遍历待处理的行
+        processed_mask = self.get_processed_mask(df, response_col)
+        processed_count = int(processed_mask.sum())
+        pending_index = df.index[~processed_mask]
+        
+        user_prompts = df.loc[pending_index, user_prompt_col].fillna("").astype(str).tolist()
+        if image_col and image_col in df.columns:
+            image_values = df.loc[pending_index, image_col].tolist()
+        else:
+            image_values = [None] * len(pending_index)
+        
+        rows_to_process = []
+        for index, user_prompt, image_value in zip(pending_index, user_prompts, image_values):
+            # 获取图片数据（支持嵌入图片和文件路径）
+            image_data = self.get_image_for_row(index, image_value)
+            rows_to_process.append((index, user_prompt, image_data))
+        
+        return rows_to_process, processed_count
+    
+    def create_rate_limiter(self, concurrency: int) -> Optional[RateLimiter]:
+        """
+        按配置创建全局限速器
+        
+        rate_limit 指定每秒请求数；未配置时按 request_delay 换算为 max_workers/request_delay，
+        与原先每个线程请求前固定等待 request_delay 的速率上限相同。两者都为0时不限速
+        
+        Args:
+            concurrency: 同时在途的请求数，只决定令牌桶容量（空闲后可连续发出的请求数），
+                异步模式调大async_concurrency不会提高速率上限
+        """
+        rate = self.config.get("rate_limit", 0)
+        if not rate:
+            request_delay = self.config.get("request_delay", 0.5)
+            if not request_delay:
+                return None
+            rate = self.config.get("max_workers", 3) / request_delay
+        return RateLimiter(rate, burst=concurrency)
+    
+    def run_requests(self, rows_to_process: List[Tuple], system_prompt: str, response_col: str) -> Dict[int, str]:
+        """合并重复请求后按配置选择线程池或asyncio并发处理，返回 {行索引: 响应}"""
+        max_workers = self.config.get("max_workers", 3)
+        use_async = self.config.get("async_mode", False)
+        # 开启http2时异步模式也可以只依赖httpx
+        if use_async and not (HAS_AIOHTTP or (HAS_HTTPX and self.config.get("http2", False))):
+            self.logger.warning("⚠️ 未安装aiohttp，async_mode 不可用，改用线程池")
+            use_async = False
+        
+        concurrency = max_workers
+        if use_async:
+            # 协程不占线程，并发数可以远高于线程池，未配置时沿用max_workers
+            concurrency = self.config.get("async_concurrency") or max_workers
+            self.logger.info(f"🚀 开始处理 {len(rows_to_process)} 条数据 (异步并发数: {concurrency})")
+        else:
+            self.logger.info(f"🚀 开始处理 {len(rows_to_process)} 条数据 (线程数: {max_workers})")
+        
+        pending_count = len(rows_to_process)
+        rows_to_process = self.group_duplicate_rows(rows_to_process)
+        if len(rows_to_process) < pending_count:
+            self.logger.info(f"🔁 合并重复提示词: {pending_count} 行只需 {len(rows_to_process)} 次请求")
+        
+        self.rate_limiter = self.create_rate_limiter(concurrency)
+        cache_hits = self.response_cache.hits if self.response_cache else 0
+        if use_async:
+            responses = asyncio.run(self.process_rows_async(
+                rows_to_process, system_prompt, response_col, concurrency
+            ))
+        else:
+            responses = self.process_rows_threaded(
+                rows_to_process, system_prompt, response_col, max_workers
+            )
         
-        # 检查用户提示列是否存在，如果不存在则创建空列
+        if self.response_cache and self.response_cache.hits > cache_hits:
+            self.logger.info(f"💾 命中响应缓存 {self.response_cache.hits - cache_hits} 次")
+        return responses
+    
+    def prepare_prompt_column(self, df: pd.DataFrame):
+        """检查用户提示列是否存在，如果不存在则创建空列"""
+        user_prompt_col = self.config["user_prompt_column"]
         if user_prompt_col not in df.columns:
             self.logger.warning(f"⚠️ 文件中不存在列 '{user_prompt_col}'，将创建空列")
             df[user_prompt_col] = ""
-        
-        # 显示当前使用的Provider和模型
+    
+    def log_provider_info(self):
+        """显示当前使用的Provider和模型"""
         provider_name = self.config.get("provider", "unknown")
         model_name = self.config.get("model_name", "unknown")
         api_type = self.provider_config.get("api_type", "unknown")
         self.logger.info(f"🤖 Provider: {provider_name} | 模型: {model_name} | API类型: {api_type}")
+    
+    def process_file(self) -> bool:
+        """处理输入文件（支持CSV、Excel和Parquet）"""
+        # 优先使用input_file，向后兼容csv_input_file
+        input_file = self.config.get("input_file") or self.config.get("csv_input_file")
+        
+        if not input_file:
+            self.logger.error("❌ 未配置输入文件")
+            return False
+        
+        output_file = self.get_output_file(input_file)
+        
+        if self.is_fully_processed(input_file, self.get_response_column()):
+            self.logger.info("✅ 所有数据已处理完成")
+            return True
+        
+        # 大CSV按块流式处理，不整表读入内存
+        chunk_size = self.config.get("chunk_size", 0)
+        if chunk_size and self.get_file_type(input_file) == "CSV":
+            if output_file == input_file:
+                return self.process_csv_in_chunks(input_file, chunk_size)
+            self.logger.warning("⚠️ 分块处理只支持写回CSV，输出为Parquet时整表读入")
+        
+        # 加载文件（已有输出文件时从中继续）
+        df = self.load_input_file(self.get_working_file(input_file))
+        if df is None:
+            return False
+        
+        self.prepare_prompt_column(df)
+        self.log_provider_info()
         
         image_col = self.config.get("image_column", "")
         has_image_col = image_col and image_col in df.columns
@@ -925,76 +1866,142 @@ class AIModelProcessor:
             return False
         
         # 使用单一的响应列，不再拆分 reasoning 和 classification
-        model_name_safe = self.config["model_name"].replace("-", "_").replace(".", "_")
-        response_col = f"ai_response_{model_name_safe}"
+        response_col = self.get_response_column()
         
-        if response_col not in df.columns:
-            df[response_col] = ""
+        self.prepare_response_column(df, response_col)
         
-        total_rows = len(df)
-        rows_to_process = []
-        processed_count = 0
+        recovered_count = self.merge_results_file(df, input_file, response_col)
+        if recovered_count:
+            self.logger.info(f"♻️ 从上次中断的结果文件恢复 {recovered_count} 条结果")
         
-        file_type = "Excel" if self.is_excel_file(input_file) else "CSV"
+        file_type = self.get_file_type(input_file)
         self.logger.info(f"📊 扫描{file_type}文件，检查处理状态...")
         
-        for index, row in df.iterrows():
-            if self.check_row_processed(df, index, response_col):
-                processed_count += 1
-                continue
-            
-            user_prompt = str(row[user_prompt_col]) if pd.notna(row[user_prompt_col]) else ""
-            
-            # 获取图片数据（支持嵌入图片和文件路径）
-            image_data = self.get_image_for_row(index, row, image_col)
-            
-            rows_to_process.append((index, user_prompt, image_data))
+        rows_to_process, processed_count = self.collect_pending_rows(df, response_col)
         
-        self.logger.info(f"📈 扫描完成: 总计 {total_rows} 行，已处理 {processed_count} 行，待处理 {len(rows_to_process)} 行")
+        self.logger.info(f"📈 扫描完成: 总计 {len(df)} 行，已处理 {processed_count} 行，待处理 {len(rows_to_process)} 行")
         
         if not rows_to_process:
+            if recovered_count:
+                self.save_output_file(df, output_file)
+                self.remove_results_file(input_file)
             self.logger.info("✅ 所有数据已处理完成")
             return True
         
-        self.logger.info(f"🚀 开始处理 {len(rows_to_process)} 条数据 (线程数: {self.config['max_workers']})")
+        # 每条结果追加写入JSONL文件，结束时只整体保存一次原文件
+        self._results_fh = open(self.get_results_file(input_file), 'ab')
+        try:
+            responses = self.run_requests(rows_to_process, system_prompt, response_col)
+        except KeyboardInterrupt:
+            # 已完成的结果都已追加到结果文件，关闭句柄写出缓冲后合并回DataFrame并保存
+            self._results_fh.close()
+            self.logger.warning("⚠️ 用户中断，保存已完成的结果...")
+            saved_count = self.merge_results_file(df, input_file, response_col)
+            if self.save_output_file(df, output_file):
+                self.remove_results_file(input_file)
+            self.session.close()
+            self.logger.info(f"💾 已保存 {saved_count} 条结果，下次运行从中断处继续")
+            return False
+        finally:
+            self._results_fh.close()
+            self._results_fh = None
+        
+        # 所有结果一次性写回DataFrame
+        new_processed_count = self.apply_responses(df, response_col, responses)
+        
+        if self.save_output_file(df, output_file):
+            # 结果已写回文件，续传用的结果文件不再需要
+            self.remove_results_file(input_file)
+        
+        self.session.close()
+        self.logger.info(f"🎉 处理完成！共处理 {new_processed_count} 条新数据")
+        return True
+    
+    def process_csv_in_chunks(self, input_file: str, chunk_size: int) -> bool:
+        """
+        按块流式处理CSV文件，内存占用只与chunk_size有关
+        
+        每块处理完立即追加写入临时文件，全部完成后原子替换原文件。
+        用户中断（Ctrl+C）时不再发送请求，剩余各块带上已完成的结果写完后照常替换原文件，
+        原文件因此包含部分结果，下次运行只处理未完成的行；收尾时再次中断或处理出错时
+        原文件不变，已完成的结果保存在JSONL结果文件中，下次运行续传
+        """
+        if not os.path.exists(input_file):
+            self.logger.error(f"❌ 文件不存在: {input_file}")
+            return False
+        
+        self.log_provider_info()
+        
+        system_prompt = self.load_system_prompt()
+        if not system_prompt:
+            self.logger.error("❌ 无法加载系统提示词")
+            return False
+        
+        response_col = self.get_response_column()
+        
+        saved_responses = self.load_results_file(input_file, response_col)
+        if saved_responses:
+            self.logger.info(f"♻️ 从上次中断的结果文件恢复 {len(saved_responses)} 条结果")
         
+        self.logger.info(f"📊 分块处理CSV文件: {input_file} (每块 {chunk_size} 行)")
+        
+        root, ext = os.path.splitext(input_file)
+        tmp_path = f"{root}.tmp{ext}"
+        total_rows = 0
         new_processed_count = 0
-        max_workers = self.config.get("max_workers", 3)
+        interrupted = False
         
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            with tqdm(total=len(rows_to_process), desc="📊 处理进度", 
-                     bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]",
-                     ncols=80) as pbar:
-                future_to_index = {}
-                for index, user_prompt, image_data in rows_to_process:
-                    future = executor.submit(
-                        self.process_single_row, 
-                        index, user_prompt, system_prompt, 
-                        df, response_col,
-                        image_data
-                    )
-                    future_to_index[future] = index
+        self._results_fh = open(self.get_results_file(input_file), 'ab')
+        try:
+            # 分块读取时行索引在各块间连续，与整表读入时一致，结果文件可以通用
+            for chunk_idx, chunk in enumerate(pd.read_csv(input_file, chunksize=chunk_size)):
+                self.prepare_prompt_column(chunk)
+                self.prepare_response_column(chunk, response_col)
+                self.apply_responses(chunk, response_col, saved_responses)
+                
+                rows_to_process, processed_count = self.collect_pending_rows(chunk, response_col)
+                total_rows += len(chunk)
+                self.logger.info(f"📦 第 {chunk_idx + 1} 块: {len(chunk)} 行，已处理 {processed_count} 行，待处理 {len(rows_to_process)} 行")
                 
-                for future in as_completed(future_to_index):
-                    index = future_to_index[future]
+                if rows_to_process and not interrupted:
                     try:
-                        success = future.result()
-                        if success:
-                            new_processed_count += 1
-                        
-                        if new_processed_count % 10 == 0:
-                            with self.csv_lock:
-                                self.save_output_file(df, input_file)
-                                
-                        pbar.update(1)
-                        
-                    except Exception as e:
-                        pbar.update(1)
-        
-        with self.csv_lock:
-            self.save_output_file(df, input_file)
-        
-        self.logger.info(f"🎉 处理完成！共处理 {new_processed_count} 条新数据")
+                        responses = self.run_requests(rows_to_process, system_prompt, response_col)
+                        new_processed_count += self.apply_responses(chunk, response_col, responses)
+                    except KeyboardInterrupt:
+                        # 已完成的结果都已追加到结果文件，写出缓冲后重新读取；
+                        # 剩余各块不再请求，只带上已有结果写入临时文件，最后照常替换原文件
+                        self.logger.warning("⚠️ 用户中断，保存已完成的结果...")
+                        interrupted = True
+                        self._results_fh.flush()
+                        saved_responses = self.load_results_file(input_file, response_col)
+                        self.apply_responses(chunk, response_col, saved_responses)
+                
+                chunk.to_csv(tmp_path, mode='w' if chunk_idx == 0 else 'a',
+                             header=chunk_idx == 0, index=False)
+        except Exception as e:
+            self.logger.error(f"❌ 分块处理失败: {str(e)}")
+            # 不在输入文件旁留下写了一半的临时文件
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+        except KeyboardInterrupt:
+            # 保存过程中再次中断：原文件不变，结果仍在结果文件中
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            self._results_fh.close()
+            self._results_fh = None
+        
+        os.replace(tmp_path, input_file)
+        # 结果已写回原文件，续传用的结果文件不再需要
+        self.remove_results_file(input_file)
+        
+        self.session.close()
+        if interrupted:
+            self.logger.info("💾 已保存已完成的结果，下次运行从中断处继续")
+            return False
+        self.logger.info(f"🎉 处理完成！总计 {total_rows} 行，共处理 {new_processed_count} 条新数据")
         return True
     
     def reset_progress(self):
@@ -1004,17 +2011,18 @@ class AIModelProcessor:
             self.logger.error(f"❌ 文件不存在: {input_file}")
             return
         
-        df = self.load_input_file(input_file)
+        working_file = self.get_working_file(input_file)
+        df = self.load_input_file(working_file)
         if df is None:
             return
         
-        model_name_safe = self.config["model_name"].replace("-", "_").replace(".", "_")
-        response_col = f"ai_response_{model_name_safe}"
+        response_col = self.get_response_column()
         
         if response_col in df.columns:
-            df[response_col] = ""
+            df[response_col] = pd.array([""] * len(df), dtype=RESPONSE_DTYPE)
         
-        self.save_output_file(df, input_file)
+        self.save_output_file(df, working_file)
+        self.remove_results_file(input_file)
         self.logger.info("🔄 进度已重置，已清空所有处理结果")
     
     def show_status(self):
@@ -1024,31 +2032,33 @@ class AIModelProcessor:
             print(f"❌ 文件不存在: {input_file}")
             return
         
-        df = self.load_input_file(input_file)
+        response_col = self.get_response_column()
+        
+        # 统计进度只需要响应列
+        working_file = self.get_working_file(input_file)
+        df = self.load_input_file(working_file, columns=[response_col])
         if df is None:
             return
         
-        model_name_safe = self.config["model_name"].replace("-", "_").replace(".", "_")
-        response_col = f"ai_response_{model_name_safe}"
+        self.prepare_response_column(df, response_col)
+        self.merge_results_file(df, input_file, response_col)
         
         total_rows = len(df)
-        processed_rows = 0
-        
-        for index in range(total_rows):
-            if self.check_row_processed(df, index, response_col):
-                processed_rows += 1
+        processed_rows = int(self.get_processed_mask(df, response_col).sum())
         
         progress_pct = processed_rows/total_rows*100 if total_rows > 0 else 0
         remaining = total_rows - processed_rows
         
         provider_name = self.config.get("provider", "unknown")
         model_name = self.config.get("model_name", "unknown")
-        file_type = "Excel" if self.is_excel_file(input_file) else "CSV"
+        file_type = self.get_file_type(input_file)
         
         print(f"\n📊 处理状态")
         print(f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
         print(f"📁 文件类型:   {file_type}")
         print(f"📄 输入文件:   {input_file}")
+        if working_file != input_file:
+            print(f"💾 输出文件:   {working_file}")
         print(f"🤖 Provider:   {provider_name}")
         print(f"📦 模型:       {model_name}")
         print(f"📝 总行数:     {total_rows:,}")
@@ -1122,6 +2132,7 @@ def main():
     # 命令行参数覆盖
     if args.workers is not None:
         processor.config["max_workers"] = args.workers
+        processor.session = processor.create_session()
         print(f"🔧 使用命令行指定的线程数: {args.workers}")
     
     if args.provider is not None:
@@ -9,27 +9,86 @@
 # ==================== 在这里修改你要测试的内容 ====================
 USER_PROMPT = """请分析这张照片的脸型和外貌特征"""
 
-# 图片路径（可选，留空则使用纯文本模式）
+# 图片路径或http(s)图片地址（可选，留空则使用纯文本模式；Gemini不支持地址）
 IMAGE_PATH = "test_face_compressed.jpg"
+
+# 同时对比多个Provider（可选，留空则只测试config.yaml中的provider）
+# 格式为 "provider" 或 "provider:模型名"，例如 ["openai:gpt-4o", "deepseek:deepseek-chat"]
+COMPARE_PROVIDERS = []
 # ================================================================
 
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import yaml
 import time
 import os
-import base64
-import mimetypes
-from typing import Dict, Any, Optional, List, Union, Tuple
+import io
+from typing import Dict, Any, Optional, List, Union, Tuple, Callable
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock
+
+# 与ai_model_processor.py共用的JSON解析、Base64编码、图片和重试工具
+from ai_common import (
+    HAS_PIL, YAML_LOADER, RETRYABLE_STATUS_CODES, SUPPORTED_IMAGE_TYPES,
+    json_loads, json_dumps, parse_json_object, parse_retry_after, compute_retry_delay,
+    b64encode_str, b64encode_file, downscale_image,
+    is_image_url, guess_image_mime,
+)
+
+# 尝试导入httpx用于HTTP/2（可选，配置 http2: true 启用，需安装 httpx[http2]）
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
+
+# 内存中缓存Base64编码结果的图片数量
+IMAGE_CACHE_SIZE = 8
+
+# 所有测试器共享的图片编码缓存: (路径, 修改时间, 大小, max_image_dim) -> (Base64, MIME类型)
+# 对比多个Provider时各测试器使用同一张图片，只需读取和编码一次
+IMAGE_CACHE: "OrderedDict[Tuple[str, int, int, int], Tuple[str, str]]" = OrderedDict()
+IMAGE_CACHE_LOCK = Lock()
+
+# 所有API请求共用的请求头
+DEFAULT_HEADERS = {"Content-Type": "application/json"}
+
+# 按网络错误重试的异常（含响应体不是合法JSON）
+HTTP_ERRORS = (requests.exceptions.RequestException, json.JSONDecodeError) + ((httpx.HTTPError,) if HAS_HTTPX else ())
 
 
 class SingleAITest:
-    def __init__(self, config_file: str = "config.yaml", providers_file: str = "providers.yaml"):
-        """初始化AI测试器"""
+    def __init__(self, config_file: str = "config.yaml", providers_file: str = "providers.yaml",
+                 provider: Optional[str] = None, model_name: Optional[str] = None,
+                 session: Union[requests.Session, "httpx.Client", None] = None):
+        """
+        初始化AI测试器
+        
+        Args:
+            provider: 覆盖config.yaml中的provider
+            model_name: 覆盖config.yaml中的model_name
+            session: 与其他测试器共用的HTTP会话，为None时自行创建；传入的会话由调用方关闭
+        """
         self.config = self.load_config(config_file)
+        if provider:
+            self.config["provider"] = provider
+        if model_name:
+            self.config["model_name"] = model_name
         self.providers = self.load_providers(providers_file)
         self.provider_config = self.get_provider_config()
-        
+        self._owns_session = session is None  # 自行创建的会话在close时关闭
+        self.session = session if session is not None else self.create_session()
+        self._api_call: Optional[Callable] = None  # 按api_type选定的call_api_*方法
+        self._endpoint: Optional[Tuple[str, Dict[str, str]]] = None  # (请求地址, 认证请求头)
+        self._system_prompt: Optional[Tuple[Tuple[str, int], str]] = None  # ((路径, 修改时间), 提示词)
+        self.output: Optional[io.StringIO] = None  # 并发对比时缓存调用过程的输出，由主线程统一打印
+        
+    def log(self, message: str):
+        """输出调用过程中的信息；设置了output时写入缓冲，避免多个线程的输出交错"""
+        print(message, file=self.output)
+    
     def load_config(self, config_file: str) -> Dict[str, Any]:
         """加载运行配置文件"""
         default_config = {
@@ -39,22 +98,27 @@ class SingleAITest:
             "max_tokens": 2000,
             "prompt_file": "system_prompt.md",
             "image_base_path": "",
-            "image_detail": "auto"
+            "image_detail": "auto",
+            "max_image_dim": 0,
+            "http2": False
         }
         
-        if os.path.exists(config_file):
+        try:
             with open(config_file, 'r', encoding='utf-8') as f:
-                user_config = yaml.safe_load(f)
+                user_config = yaml.load(f, Loader=YAML_LOADER)
                 default_config.update(user_config)
+        except FileNotFoundError:
+            pass
         
         return default_config
     
     def load_providers(self, providers_file: str) -> Dict[str, Any]:
         """加载Provider配置文件"""
-        if os.path.exists(providers_file):
+        try:
             with open(providers_file, 'r', encoding='utf-8') as f:
-                return yaml.safe_load(f)
-        return {"providers": {}, "default_provider": "openai"}
+                return yaml.load(f, Loader=YAML_LOADER)
+        except FileNotFoundError:
+            return {"providers": {}, "default_provider": "openai"}
     
     def get_provider_config(self) -> Dict[str, Any]:
         """获取当前Provider的配置，支持从环境变量读取API密钥"""
@@ -77,12 +141,44 @@ class SingleAITest:
         
         return config
     
+    def create_session(self) -> Union[requests.Session, "httpx.Client"]:
+        """
+        创建HTTP会话，重试和多次调用复用同一条keep-alive连接，省去重复的TCP/TLS握手
+        
+        配置 http2: true 且安装了 httpx[http2] 时使用httpx的HTTP/2客户端
+        """
+        if self.config.get("http2", False):
+            if HAS_HTTPX:
+                try:
+                    return httpx.Client(http2=True, headers=DEFAULT_HEADERS)
+                except ImportError:
+                    pass
+            print("⚠️  未安装 httpx[http2]，http2 不可用，改用requests")
+        
+        session = requests.Session()
+        # 重试由call_api_*自己控制，urllib3层不再重试
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(DEFAULT_HEADERS)
+        return session
+    
+    def close(self):
+        """关闭自行创建的HTTP会话"""
+        if self._owns_session:
+            self.session.close()
+    
     def load_system_prompt(self) -> str:
-        """加载系统提示词"""
+        """加载系统提示词，文件未修改时直接返回上次的结果"""
         prompt_file = self.config["prompt_file"]
-        if not os.path.exists(prompt_file):
+        # os.stat同时完成存在性检查
+        try:
+            key = (prompt_file, os.stat(prompt_file).st_mtime_ns)
+        except FileNotFoundError:
             print(f"❌ 提示词文件不存在: {prompt_file}")
             return ""
+        if self._system_prompt and self._system_prompt[0] == key:
+            return self._system_prompt[1]
         
         with open(prompt_file, 'r', encoding='utf-8') as f:
             content = f.read()
@@ -93,57 +189,94 @@ class SingleAITest:
             if end > start:
                 content = content[start:end]
         
-        return content.strip()
+        content = content.strip()
+        self._system_prompt = (key, content)
+        return content
     
-    def encode_image_to_base64(self, image_path: str) -> Optional[str]:
-        """将本地图片转换为Base64编码的data URL"""
-        if not os.path.exists(image_path):
-            print(f"❌ 图片不存在: {image_path}")
-            return None
-        
-        mime_type, _ = mimetypes.guess_type(image_path)
-        supported_types = ['image/jpeg', 'image/png', 'image/gif', 'image/webp']
-        
-        if mime_type not in supported_types:
-            print(f"❌ 不支持的图片格式: {mime_type}")
+    def load_image_base64(self, image_path: str, mime_type: str) -> Tuple[str, str]:
+        """
+        读取图片并Base64编码，返回 (Base64数据, MIME类型)
+        
+        结果存入模块级的IMAGE_CACHE，对比多个Provider时并发的测试器只有一个读取编码，
+        其余等待后直接复用；文件修改后自动重新编码。
+        配置了max_image_dim时，过大的图片缩小为JPEG，返回的MIME类型随之变为image/jpeg
+        """
+        stat = os.stat(image_path)
+        max_dim = self.config.get("max_image_dim", 0)
+        key = (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size, max_dim)
+        with IMAGE_CACHE_LOCK:
+            image_data = IMAGE_CACHE.get(key)
+            if image_data is not None:
+                IMAGE_CACHE.move_to_end(key)
+                return image_data
+            
+            image_data = self.encode_image(image_path, mime_type, max_dim)
+            IMAGE_CACHE[key] = image_data
+            while len(IMAGE_CACHE) > IMAGE_CACHE_SIZE:
+                IMAGE_CACHE.popitem(last=False)
+            return image_data
+    
+    def encode_image(self, image_path: str, mime_type: str, max_dim: int) -> Tuple[str, str]:
+        """读取图片并Base64编码，max_dim非0时先缩小过大的图片，返回 (Base64数据, MIME类型)"""
+        image_data = None
+        if max_dim and HAS_PIL:
+            try:
+                resized = downscale_image(image_path, max_dim)
+            except Exception as e:
+                # Pillow无法解析的图片按原样发送
+                self.log(f"⚠️  缩小图片失败，按原图发送: {str(e)}")
+                resized = None
+            if resized is not None:
+                image_data = (b64encode_str(resized), 'image/jpeg')
+                self.log(f"🗜️  图片已缩小到长边 {max_dim} 像素")
+        if image_data is None:
+            image_data = (b64encode_file(image_path), mime_type)
+        return image_data
+    
+    def get_image_base64_raw(self, image_path: str,
+                             supported_types: Optional[frozenset] = None) -> Optional[Tuple[str, str]]:
+        """
+        获取图片的原始Base64数据和MIME类型，失败时输出原因并返回None
+        
+        Args:
+            supported_types: 只接受这些MIME类型，为None时接受mimetypes能识别的任意类型
+        """
+        # 先按扩展名判断格式，不支持的图片不必访问文件系统
+        mime_type = guess_image_mime(image_path)
+        if not mime_type or (supported_types and mime_type not in supported_types):
+            self.log(f"❌ 不支持的图片格式: {mime_type or image_path}")
             return None
         
         try:
-            with open(image_path, 'rb') as f:
-                image_data = base64.b64encode(f.read()).decode('utf-8')
-            return f"data:{mime_type};base64,{image_data}"
+            # load_image_base64内部的os.stat同时完成存在性检查
+            return self.load_image_base64(image_path, mime_type)
+        except FileNotFoundError:
+            self.log(f"❌ 图片不存在: {image_path}")
+            return None
         except Exception as e:
-            print(f"❌ 读取图片失败: {str(e)}")
+            self.log(f"❌ 读取图片失败: {str(e)}")
             return None
     
-    def get_image_base64_raw(self, image_path: str) -> Optional[Tuple[str, str]]:
-        """获取图片的原始Base64数据和MIME类型"""
-        if not os.path.exists(image_path):
-            return None
-        
-        mime_type, _ = mimetypes.guess_type(image_path)
-        if not mime_type:
-            return None
-        
-        try:
-            with open(image_path, 'rb') as f:
-                image_data = base64.b64encode(f.read()).decode('utf-8')
-            return image_data, mime_type
-        except:
+    def encode_image_to_base64(self, image_path: str) -> Optional[str]:
+        """将本地图片转换为Base64编码的data URL（与get_image_base64_raw共用同一份缓存的编码结果）"""
+        result = self.get_image_base64_raw(image_path, SUPPORTED_IMAGE_TYPES)
+        if not result:
             return None
+        image_data, mime_type = result
+        return f"data:{mime_type};base64,{image_data}"
     
     def build_user_message_openai(self, text: str, image_path: str = None) -> Union[str, List]:
         """构建OpenAI格式的用户消息"""
         if not image_path:
             return text
         
-        image_base_path = self.config.get("image_base_path", "")
-        if image_base_path and not os.path.isabs(image_path):
-            image_path = os.path.join(image_base_path, image_path)
-        
-        image_url = self.encode_image_to_base64(image_path)
-        if not image_url:
-            return text
+        if is_image_url(image_path):
+            # 由服务端自行下载，不必在本地读取和编码
+            image_url = image_path
+        else:
+            image_url = self.encode_image_to_base64(image_path)
+            if not image_url:
+                return text
         
         content = []
         if text and text.strip():
@@ -163,11 +296,16 @@ class SingleAITest:
         """构建Anthropic格式的用户消息"""
         content = []
         
-        if image_path:
-            image_base_path = self.config.get("image_base_path", "")
-            if image_base_path and not os.path.isabs(image_path):
-                image_path = os.path.join(image_base_path, image_path)
-            
+        if image_path and is_image_url(image_path):
+            # 按地址引用，请求体不含图片数据
+            content.append({
+                "type": "image",
+                "source": {
+                    "type": "url",
+                    "url": image_path
+                }
+            })
+        elif image_path:
             result = self.get_image_base64_raw(image_path)
             if result:
                 image_data, mime_type = result
@@ -185,13 +323,86 @@ class SingleAITest:
         
         return content if content else [{"type": "text", "text": text or ""}]
     
+    def get_retry_delay(self, attempt: int, response: Optional[Any] = None) -> Optional[float]:
+        """
+        计算第attempt次失败后的等待时间（见compute_retry_delay）
+        
+        服务端要求的Retry-After超过retry_after_cap秒时返回None，调用方放弃该请求
+        """
+        retry_after = parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+        delay = compute_retry_delay(self.provider_config, attempt, retry_after)
+        if delay is None:
+            self.log(f"❌ 服务端要求 {retry_after:.0f} 秒后重试，超过retry_after_cap，放弃该请求")
+        return delay
+    
+    def post_with_retry(self, url: str, data: Dict[str, Any],
+                        headers: Optional[Dict[str, str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        发送POST请求，对网络错误、429和5xx进行重试，其余4xx（如密钥错误）直接失败
+        
+        Returns:
+            状态码200时的响应JSON，失败返回None
+        """
+        max_retries = self.provider_config.get("max_retries", 3)
+        timeout = self.provider_config.get("timeout", 60)
+        # 请求体只序列化一次，重试时直接复用（Content-Type已在会话上设置）
+        body = json_dumps(data)
+        
+        for attempt in range(max_retries):
+            response = None
+            try:
+                if HAS_HTTPX and isinstance(self.session, httpx.Client):
+                    response = self.session.post(url, headers=headers, content=body, timeout=timeout)
+                else:
+                    response = self.session.post(url, headers=headers, data=body, timeout=timeout)
+                
+                if response.status_code == 200:
+                    # 直接解析响应字节，省去先解码成str
+                    return json_loads(response.content)
+                
+                self.log(f"❌ API调用失败 (状态码: {response.status_code})")
+                self.log(f"响应内容: {response.text[:200]}")
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    return None
+                
+            except HTTP_ERRORS as e:
+                if attempt == max_retries - 1:
+                    self.log(f"❌ API调用失败: {str(e)}")
+            
+            if attempt < max_retries - 1:
+                delay = self.get_retry_delay(attempt, response)
+                if delay is None:
+                    return None
+                self.log(f"⚠️  第 {attempt + 1} 次尝试失败，重试中...")
+                time.sleep(delay)
+        
+        return None
+    
+    def get_endpoint(self) -> Tuple[str, Dict[str, str]]:
+        """
+        获取当前Provider的 (请求地址, 认证请求头)，首次调用后缓存
+        
+        地址和密钥在一次测试中不变，不必每次调用都重新拼接（Gemini的地址包含模型名和密钥）
+        """
+        if self._endpoint is None:
+            api_type = self.provider_config.get("api_type", "openai")
+            api_key = self.provider_config['api_key']
+            url = self.provider_config["api_url"]
+            if api_type == "anthropic":
+                headers = {
+                    "x-api-key": api_key,
+                    "anthropic-version": self.provider_config.get("api_version", "2023-06-01")
+                }
+            elif api_type == "google":
+                url = f"{url}/models/{self.config['model_name']}:generateContent?key={api_key}"
+                headers = {}
+            else:
+                headers = {"Authorization": f"Bearer {api_key}"}
+            self._endpoint = (url, headers)
+        return self._endpoint
+    
     def call_api_openai(self, user_prompt: str, system_prompt: str, image_path: str = None) -> Optional[str]:
         """调用OpenAI兼容格式的API"""
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.provider_config['api_key']}"
-        }
-        
         user_content = self.build_user_message_openai(user_prompt, image_path)
         
         data = {
@@ -206,43 +417,14 @@ class SingleAITest:
         if "max_tokens" in self.config:
             data["max_tokens"] = self.config["max_tokens"]
         
-        max_retries = self.provider_config.get("max_retries", 3)
-        retry_delay = self.provider_config.get("retry_delay", 1)
-        
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(
-                    self.provider_config["api_url"],
-                    headers=headers,
-                    json=data,
-                    timeout=self.provider_config.get("timeout", 60)
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if "choices" in result and len(result["choices"]) > 0:
-                        return result["choices"][0]["message"]["content"]
-                else:
-                    print(f"❌ API调用失败 (状态码: {response.status_code})")
-                    print(f"响应内容: {response.text[:200]}")
-                
-            except requests.exceptions.RequestException as e:
-                if attempt == max_retries - 1:
-                    print(f"❌ API调用失败: {str(e)}")
-                else:
-                    print(f"⚠️  第 {attempt + 1} 次尝试失败，重试中...")
-                    time.sleep(retry_delay * (attempt + 1))
-        
+        url, headers = self.get_endpoint()
+        result = self.post_with_retry(url, data, headers)
+        if result and "choices" in result and len(result["choices"]) > 0:
+            return result["choices"][0]["message"]["content"]
         return None
     
     def call_api_anthropic(self, user_prompt: str, system_prompt: str, image_path: str = None) -> Optional[str]:
         """调用Anthropic Claude API"""
-        headers = {
-            "Content-Type": "application/json",
-            "x-api-key": self.provider_config['api_key'],
-            "anthropic-version": self.provider_config.get("api_version", "2023-06-01")
-        }
-        
         user_content = self.build_user_message_anthropic(user_prompt, image_path)
         
         data = {
@@ -257,55 +439,24 @@ class SingleAITest:
         if "temperature" in self.config:
             data["temperature"] = self.config["temperature"]
         
-        max_retries = self.provider_config.get("max_retries", 3)
-        retry_delay = self.provider_config.get("retry_delay", 2)
-        
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(
-                    self.provider_config["api_url"],
-                    headers=headers,
-                    json=data,
-                    timeout=self.provider_config.get("timeout", 60)
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if "content" in result and len(result["content"]) > 0:
-                        return result["content"][0]["text"]
-                else:
-                    print(f"❌ API调用失败 (状态码: {response.status_code})")
-                    print(f"响应内容: {response.text[:200]}")
-                
-            except requests.exceptions.RequestException as e:
-                if attempt == max_retries - 1:
-                    print(f"❌ API调用失败: {str(e)}")
-                else:
-                    print(f"⚠️  第 {attempt + 1} 次尝试失败，重试中...")
-                    time.sleep(retry_delay * (attempt + 1))
-        
+        url, headers = self.get_endpoint()
+        result = self.post_with_retry(url, data, headers)
+        if result and "content" in result and len(result["content"]) > 0:
+            return result["content"][0]["text"]
         return None
     
     def call_api_google(self, user_prompt: str, system_prompt: str, image_path: str = None) -> Optional[str]:
         """调用Google Gemini API"""
-        model_name = self.config["model_name"]
-        api_key = self.provider_config['api_key']
-        base_url = self.provider_config["api_url"]
-        url = f"{base_url}/models/{model_name}:generateContent?key={api_key}"
-        
-        headers = {"Content-Type": "application/json"}
-        
         parts = []
         if system_prompt:
             parts.append({"text": f"System: {system_prompt}\n\nUser: {user_prompt}"})
         else:
             parts.append({"text": user_prompt})
         
-        if image_path:
-            image_base_path = self.config.get("image_base_path", "")
-            if image_base_path and not os.path.isabs(image_path):
-                image_path = os.path.join(image_base_path, image_path)
-            
+        if image_path and is_image_url(image_path):
+            # generateContent的inline_data只接受图片数据，不会下载地址
+            self.log(f"⚠️  Gemini不支持图片地址，已忽略图片: {image_path}")
+        elif image_path:
             result = self.get_image_base64_raw(image_path)
             if result:
                 image_data, mime_type = result
@@ -324,89 +475,76 @@ class SingleAITest:
             }
         }
         
-        max_retries = self.provider_config.get("max_retries", 3)
-        retry_delay = self.provider_config.get("retry_delay", 2)
-        
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(
-                    url,
-                    headers=headers,
-                    json=data,
-                    timeout=self.provider_config.get("timeout", 60)
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if "candidates" in result and len(result["candidates"]) > 0:
-                        candidate = result["candidates"][0]
-                        if "content" in candidate and "parts" in candidate["content"]:
-                            return candidate["content"]["parts"][0]["text"]
-                else:
-                    print(f"❌ API调用失败 (状态码: {response.status_code})")
-                    print(f"响应内容: {response.text[:200]}")
-                
-            except requests.exceptions.RequestException as e:
-                if attempt == max_retries - 1:
-                    print(f"❌ API调用失败: {str(e)}")
-                else:
-                    print(f"⚠️  第 {attempt + 1} 次尝试失败，重试中...")
-                    time.sleep(retry_delay * (attempt + 1))
-        
+        url, headers = self.get_endpoint()
+        result = self.post_with_retry(url, data, headers)
+        if result and "candidates" in result and len(result["candidates"]) > 0:
+            candidate = result["candidates"][0]
+            if "content" in candidate and "parts" in candidate["content"]:
+                return candidate["content"]["parts"][0]["text"]
         return None
     
+    def resolve_image_path(self, image_path: Optional[str]) -> Optional[str]:
+        """本地图片的相对路径拼接image_base_path，调用各Provider前只处理一次；http(s)地址原样返回"""
+        if not image_path or is_image_url(image_path):
+            return image_path
+        image_base_path = self.config.get("image_base_path", "")
+        if image_base_path and not os.path.isabs(image_path):
+            return os.path.join(image_base_path, image_path)
+        return image_path
+    
+    def get_api_call(self) -> Optional[Callable]:
+        """根据api_type获取对应的call_api_*方法，首次调用后缓存；不支持的API类型返回None"""
+        if self._api_call is None:
+            api_type = self.provider_config.get("api_type", "openai")
+            api_call = {
+                "openai": self.call_api_openai,
+                "anthropic": self.call_api_anthropic,
+                "google": self.call_api_google,
+            }.get(api_type)
+            if api_call is None:
+                self.log(f"❌ 不支持的API类型: {api_type}")
+                return None
+            self._api_call = api_call
+        return self._api_call
+    
     def call_ai_api(self, user_prompt: str, system_prompt: str, image_path: str = None) -> Optional[Dict[str, Any]]:
         """统一的API调用入口"""
         api_type = self.provider_config.get("api_type", "openai")
         
-        print(f"🚀 正在调用AI API...")
-        print(f"   Provider: {self.config.get('provider', 'unknown')}")
-        print(f"   模型: {self.config['model_name']}")
-        print(f"   API类型: {api_type}")
+        self.log(f"🚀 正在调用AI API...")
+        self.log(f"   Provider: {self.config.get('provider', 'unknown')}")
+        self.log(f"   模型: {self.config['model_name']}")
+        self.log(f"   API类型: {api_type}")
         if image_path:
-            print(f"   🖼️ 图片: {image_path}")
-        
-        if api_type == "openai":
-            content = self.call_api_openai(user_prompt, system_prompt, image_path)
-        elif api_type == "anthropic":
-            content = self.call_api_anthropic(user_prompt, system_prompt, image_path)
-        elif api_type == "google":
-            content = self.call_api_google(user_prompt, system_prompt, image_path)
-        else:
-            print(f"❌ 不支持的API类型: {api_type}")
+            self.log(f"   🖼️ 图片: {image_path}")
+        
+        api_call = self.get_api_call()
+        if api_call is None:
             return None
         
+        image_path = self.resolve_image_path(image_path)
+        content = api_call(user_prompt, system_prompt, image_path)
         if content:
             return self.parse_ai_response(content)
         return None
     
     def parse_ai_response(self, content: str) -> Optional[Dict[str, Any]]:
-        """解析AI返回的JSON内容"""
-        try:
-            if content.strip().startswith('{') and content.strip().endswith('}'):
-                return json.loads(content)
-            
-            if '```json' in content:
-                start = content.find('```json') + 7
-                end = content.find('```', start)
-                if end > start:
-                    json_content = content[start:end].strip()
-                    return json.loads(json_content)
-            
-            start = content.find('{')
-            end = content.rfind('}') + 1
-            if start >= 0 and end > start:
-                json_content = content[start:end]
-                return json.loads(json_content)
-            
-            print(f"❌ 无法解析AI响应为JSON")
-            print(f"原始响应: {content}")
-            return None
-            
-        except json.JSONDecodeError as e:
-            print(f"❌ JSON解析错误: {str(e)}")
-            print(f"原始响应: {content}")
-            return None
+        """
+        解析AI返回的JSON内容
+        
+        依次尝试整段、```json 代码块和括号配对完整的顶层对象（见parse_json_object），
+        只接受解析结果为对象的片段，不会把解析失败的对象内部的子对象当成结果
+        """
+        result, error = parse_json_object(content)
+        if result is not None:
+            return result
+        
+        if error:
+            self.log(f"❌ JSON解析错误: {str(error)}")
+        else:
+            self.log(f"❌ 无法解析AI响应为JSON")
+        self.log(f"原始响应: {content}")
+        return None
     
     def test_single_prompt(self, user_prompt: str, image_path: str = None):
         """测试单个提示词"""
@@ -431,7 +569,10 @@ class SingleAITest:
         print("-" * 80)
         
         result = self.call_ai_api(user_prompt, system_prompt, image_path)
-        
+        self.print_result(result)
+    
+    def print_result(self, result: Optional[Dict[str, Any]]):
+        """输出识别结果"""
         if result:
             print("\n✅ AI识别结果:")
             print("="*80)
@@ -455,8 +596,68 @@ class SingleAITest:
         print()
 
 
+def compare_providers(targets: List[str], user_prompt: str, image_path: str = None):
+    """
+    并发调用多个Provider测试同一提示词，按完成顺序输出结果
+    
+    请求都在等待网络，线程并发后总耗时约等于最慢的一个Provider；
+    所有测试器共用第一个测试器创建的HTTP会话和连接池，同一主机的多个模型复用keep-alive连接
+    
+    Args:
+        targets: "provider" 或 "provider:模型名" 列表
+    """
+    testers = []
+    owner = None  # 创建共享会话的测试器，结束时由它关闭会话
+    try:
+        for target in targets:
+            provider, _, model_name = target.partition(":")
+            tester = SingleAITest(provider=provider.strip(), model_name=model_name.strip() or None,
+                                  session=owner.session if owner else None)
+            if owner is None:
+                owner = tester
+            if not tester.provider_config.get("api_key"):
+                print(f"⚠️  '{provider}' 未设置API密钥，跳过")
+                continue
+            # 各线程的调用过程先写入各自的缓冲，按完成顺序随结果一起打印
+            tester.output = io.StringIO()
+            testers.append(tester)
+        
+        if not testers:
+            return
+        
+        system_prompt = testers[0].load_system_prompt()
+        if not system_prompt:
+            print("❌ 无法加载系统提示词")
+            return
+        
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(testers)) as executor:
+            future_to_tester = {
+                executor.submit(tester.call_ai_api, user_prompt, system_prompt, image_path): tester
+                for tester in testers
+            }
+            for future in as_completed(future_to_tester):
+                tester = future_to_tester[future]
+                print("\n" + "="*80)
+                print(f"🤖 {tester.config.get('provider')} | {tester.config['model_name']} "
+                      f"({time.monotonic() - started:.1f}s)")
+                print(tester.output.getvalue(), end="")
+                try:
+                    tester.print_result(future.result())
+                except Exception as e:
+                    print(f"\n❌ 调用出错: {str(e)}")
+    finally:
+        if owner:
+            owner.close()
+
+
 def main():
     """主函数"""
+    image_path = IMAGE_PATH.strip() if IMAGE_PATH else None
+    if COMPARE_PROVIDERS:
+        compare_providers(COMPARE_PROVIDERS, USER_PROMPT.strip(), image_path)
+        return
+    
     tester = SingleAITest()
     
     # 检查API密钥
@@ -465,9 +666,10 @@ def main():
         print(f"⚠️  请在 providers.yaml 中为 '{provider_name}' 设置API密钥，或设置环境变量 {provider_name.upper()}_API_KEY")
         return
     
-    image_path = IMAGE_PATH.strip() if IMAGE_PATH else None
-    
-    tester.test_single_prompt(USER_PROMPT.strip(), image_path)
+    try:
+        tester.test_single_prompt(USER_PROMPT.strip(), image_path)
+    finally:
+        tester.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,62 @@
+"""测试公用的fixture：导入src下的脚本、在临时目录中创建处理器、可控的假时钟"""
+import os
+import sys
+
+import pytest
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import ai_model_processor
+
+
+class FakeClock:
+    """替代time.monotonic/time.sleep，sleep只推进时间不真正等待"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def fake_clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ai_model_processor.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(ai_model_processor.time, "sleep", clock.sleep)
+    return clock
+
+
+@pytest.fixture
+def make_processor(tmp_path, monkeypatch):
+    """在临时目录中按给定配置创建AIModelProcessor，返回工厂函数"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "prompt.md").write_text("Return JSON.", encoding="utf-8")
+    providers = {"providers": {"test": {
+        "api_url": "http://127.0.0.1:9/v1/chat/completions",
+        "api_key": "test-key",
+        "api_type": "openai",
+        "max_retries": 1,
+    }}}
+    (tmp_path / "providers.yaml").write_text(yaml.safe_dump(providers), encoding="utf-8")
+
+    def factory(**overrides):
+        config = {
+            "provider": "test",
+            "model_name": "test-model",
+            "input_file": "in.csv",
+            "prompt_file": "prompt.md",
+            "user_prompt_column": "user_prompt",
+            "request_delay": 0,
+        }
+        config.update(overrides)
+        (tmp_path / "config.yaml").write_text(yaml.safe_dump(config, allow_unicode=True), encoding="utf-8")
+        return ai_model_processor.AIModelProcessor("config.yaml", "providers.yaml")
+
+    return factory
@@ -0,0 +1,80 @@
+"""ai_common.py 中共用工具函数的测试"""
+import base64
+
+import pytest
+
+import ai_common
+from ai_common import (
+    b64encode_file, compute_retry_delay, guess_image_mime, iter_json_spans,
+    parse_json_object, parse_retry_after,
+)
+
+
+def test_iter_json_spans_returns_top_level_objects_only():
+    text = '前言 {"a": {"b": 1}} 中间 {"s": "含有 { 和 \\" 的字符串"} 结尾'
+    spans = [text[start:end] for start, end in iter_json_spans(text)]
+    assert spans == ['{"a": {"b": 1}}', '{"s": "含有 { 和 \\" 的字符串"}']
+
+
+def test_iter_json_spans_skips_unbalanced_object():
+    assert list(iter_json_spans('{"a": {"k": 1}, "b": ')) == []
+
+
+@pytest.mark.parametrize("content, expected", [
+    ('{"category": "猫"}', {"category": "猫"}),
+    ('结果如下:\n```json\n{"category": "狗"}\n```', {"category": "狗"}),
+    ('```json\n[1, 2]\n```\n{"category": "鸟"}', {"category": "鸟"}),
+    ('{"a": {"k": 1}, bad} 重试: {"category": "鱼"}', {"category": "鱼"}),
+])
+def test_parse_json_object(content, expected):
+    assert parse_json_object(content) == (expected, None)
+
+
+def test_parse_json_object_does_not_return_nested_object_of_truncated_outer():
+    result, error = parse_json_object('{"a": {"k": 1}, "b": ')
+    assert result is None
+
+
+def test_parse_json_object_reports_first_decode_error():
+    result, error = parse_json_object('{"a": {"k": 1}, bad}')
+    assert result is None
+    assert error is not None
+
+
+def test_parse_json_object_rejects_non_objects():
+    assert parse_json_object('[1, 2, 3]') == (None, None)
+    assert parse_json_object('没有JSON') == (None, None)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after("Fri, 01 Jan 2100 00:00:00 GMT") > 86400
+
+
+def test_compute_retry_delay_backoff_is_capped(monkeypatch):
+    monkeypatch.setattr(ai_common.random, "uniform", lambda low, high: high)
+    config = {"retry_delay": 2, "retry_cap": 30}
+    assert [compute_retry_delay(config, attempt) for attempt in range(6)] == [2, 4, 8, 16, 30, 30]
+
+
+def test_compute_retry_delay_retry_after():
+    config = {"retry_delay": 0.01, "retry_cap": 0.01, "retry_after_cap": 60}
+    assert compute_retry_delay(config, 0, 10.0) == 10.0
+    assert compute_retry_delay(config, 0, 61.0) is None
+
+
+def test_b64encode_file_matches_single_shot_encoding(tmp_path, monkeypatch):
+    # 块大小改小，让文件跨越多个块且最后一块不满
+    monkeypatch.setattr(ai_common, "IMAGE_READ_CHUNK", 6)
+    data = bytes(range(256)) * 3 + b"tail"
+    path = tmp_path / "img.bin"
+    path.write_bytes(data)
+    assert b64encode_file(str(path)) == base64.b64encode(data).decode("ascii")
+
+
+def test_guess_image_mime():
+    assert guess_image_mime("a/B.JPG") == "image/jpeg"
+    assert guess_image_mime("x.bmp") == "image/bmp"
+    assert guess_image_mime("noext") is None
@@ -0,0 +1,263 @@
+"""ai_model_processor.py 的测试"""
+import ai_model_processor
+
+
+def test_fallback_rate_uses_max_workers_not_async_concurrency(make_processor, monkeypatch):
+    processor = make_processor(max_workers=1, request_delay=1, rate_limit=0,
+                               async_mode=True, async_concurrency=50)
+    monkeypatch.setattr(ai_model_processor, "HAS_AIOHTTP", True)
+
+    async def no_requests(*args):
+        return {}
+    monkeypatch.setattr(processor, "process_rows_async", no_requests)
+
+    processor.run_requests([(0, "hello", None)], "system", "response")
+
+    # 速率上限仍是 max_workers / request_delay，async_concurrency只决定令牌桶容量
+    assert processor.rate_limiter.rate == 1.0
+    assert processor.rate_limiter.burst == 50
+
+
+def test_rate_limiter_caps_effective_rate(make_processor, fake_clock):
+    processor = make_processor(max_workers=2, request_delay=1, rate_limit=0)
+    limiter = processor.create_rate_limiter(50)
+
+    # 空闲后最多连续发出burst个请求，之后每个请求间隔 1 / rate 秒
+    waits = [limiter.reserve() for _ in range(54)]
+    assert waits[:50] == [0.0] * 50
+    assert waits[50:] == [0.5, 1.0, 1.5, 2.0]
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, headers=None, content=b"{}"):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = content
+
+
+def test_retry_after_is_lower_bound_within_cap(make_processor):
+    processor = make_processor()
+    processor.provider_config.update(retry_delay=0.01, retry_cap=0.01, retry_after_cap=120)
+    assert processor.get_retry_delay(0, FakeResponse(429, {"Retry-After": "5"})) == 5.0
+
+
+def test_retry_after_beyond_cap_gives_up(make_processor):
+    processor = make_processor()
+    processor.provider_config["retry_after_cap"] = 120
+    assert processor.get_retry_delay(0, FakeResponse(429, {"Retry-After": "86400"})) is None
+    far_future = "Fri, 01 Jan 2100 00:00:00 GMT"
+    assert processor.get_retry_delay(0, FakeResponse(429, {"Retry-After": far_future})) is None
+
+
+def test_post_with_retry_does_not_sleep_on_bogus_retry_after(make_processor, fake_clock, monkeypatch):
+    processor = make_processor()
+    processor.provider_config["max_retries"] = 3
+    calls = []
+
+    class Session:
+        def post(self, *args, **kwargs):
+            calls.append(1)
+            return FakeResponse(429, {"Retry-After": "86400"})
+    monkeypatch.setattr(processor, "get_session", lambda: Session())
+
+    assert processor.post_with_retry("http://example.invalid", {}) is None
+    assert len(calls) == 1
+    assert fake_clock.sleeps == []
+
+
+RESPONSE_COL = "ai_response_test_model"
+
+
+def write_input_csv(path, count):
+    ai_model_processor.pd.DataFrame({"user_prompt": [f"p{i}" for i in range(count)]}).to_csv(path, index=False)
+
+
+def write_results_file(path, results):
+    with open(path, "w", encoding="utf-8") as f:
+        for index, response in results.items():
+            record = {"index": index, "column": RESPONSE_COL, "response": response}
+            f.write(ai_model_processor.json.dumps(record, ensure_ascii=False) + "\n")
+        # 上次中断时写了一半的最后一行
+        f.write('{"index": 9, "col')
+
+
+def fake_api(processor, monkeypatch):
+    """用回显提示词的假接口替代call_ai_api，返回记录请求提示词的列表"""
+    calls = []
+
+    def call_ai_api(user_prompt, system_prompt, image_path=None):
+        calls.append(user_prompt)
+        return {"echo": user_prompt}
+    monkeypatch.setattr(processor, "call_ai_api", call_ai_api)
+    return calls
+
+
+def read_responses(path):
+    df = ai_model_processor.pd.read_csv(path)
+    return [ai_model_processor.json.loads(value)["echo"] for value in df[RESPONSE_COL]], df
+
+
+def test_process_file_resumes_from_results_file(make_processor, monkeypatch, tmp_path):
+    write_input_csv(tmp_path / "in.csv", 4)
+    write_results_file(tmp_path / "in.csv.results.jsonl", {1: '{"echo": "p1"}', 3: '{"echo": "p3"}'})
+    processor = make_processor(max_workers=1)
+    calls = fake_api(processor, monkeypatch)
+
+    assert processor.process_file()
+
+    assert sorted(calls) == ["p0", "p2"]
+    assert read_responses(tmp_path / "in.csv")[0] == ["p0", "p1", "p2", "p3"]
+    assert not (tmp_path / "in.csv.results.jsonl").exists()
+    assert not (tmp_path / "in.tmp.csv").exists()
+
+
+def test_chunked_processing_resumes_and_keeps_row_indices(make_processor, monkeypatch, tmp_path):
+    write_input_csv(tmp_path / "in.csv", 5)
+    # 索引3在第二块中，续传结果要按全局行索引对应
+    write_results_file(tmp_path / "in.csv.results.jsonl", {3: '{"echo": "p3"}'})
+    processor = make_processor(max_workers=1, chunk_size=2)
+    calls = fake_api(processor, monkeypatch)
+
+    assert processor.process_file()
+
+    assert sorted(calls) == ["p0", "p1", "p2", "p4"]
+    responses, df = read_responses(tmp_path / "in.csv")
+    assert responses == ["p0", "p1", "p2", "p3", "p4"]
+    assert df["user_prompt"].tolist() == [f"p{i}" for i in range(5)]
+    assert not (tmp_path / "in.csv.results.jsonl").exists()
+
+
+def test_chunked_interrupt_saves_finished_rows(make_processor, monkeypatch, tmp_path):
+    write_input_csv(tmp_path / "in.csv", 6)
+    processor = make_processor(max_workers=1, chunk_size=2)
+    requested = []
+
+    def run_requests(rows_to_process, system_prompt, response_col):
+        # 第二块只完成第一行就被中断
+        requested.append([index for index, _, _ in rows_to_process])
+        responses = {}
+        index, user_prompt, _ = rows_to_process[0]
+        processor.record_row_result(responses, [index], response_col, {"echo": user_prompt})
+        if len(requested) == 2:
+            raise KeyboardInterrupt
+        for index, user_prompt, _ in rows_to_process[1:]:
+            processor.record_row_result(responses, [index], response_col, {"echo": user_prompt})
+        return responses
+    monkeypatch.setattr(processor, "run_requests", run_requests)
+
+    assert processor.process_file() is False
+
+    # 中断后剩余各块不再请求，但照常写回原文件
+    assert requested == [[0, 1], [2, 3]]
+    df = ai_model_processor.pd.read_csv(tmp_path / "in.csv")
+    assert len(df) == 6
+    assert df[RESPONSE_COL].notna().tolist() == [True, True, True, False, False, False]
+    assert not (tmp_path / "in.csv.results.jsonl").exists()
+    assert not (tmp_path / "in.tmp.csv").exists()
+
+
+def test_is_fully_processed_and_collect_pending_rows(make_processor, tmp_path):
+    processor = make_processor()
+    df = ai_model_processor.pd.DataFrame({"user_prompt": ["a", None, "c"], RESPONSE_COL: ["done", "", " "]})
+    df.to_csv(tmp_path / "in.csv", index=False)
+
+    rows, processed_count = processor.collect_pending_rows(df, RESPONSE_COL)
+    assert processed_count == 1
+    assert rows == [(1, "", None), (2, "c", None)]
+    assert not processor.is_fully_processed("in.csv", RESPONSE_COL)
+
+    df[RESPONSE_COL] = "done"
+    df.to_csv(tmp_path / "in.csv", index=False)
+    assert processor.is_fully_processed("in.csv", RESPONSE_COL)
+    # 有待合并的结果文件时必须完整加载
+    (tmp_path / "in.csv.results.jsonl").write_text("")
+    assert not processor.is_fully_processed("in.csv", RESPONSE_COL)
+
+
+def test_save_output_file_keeps_original_on_failure(make_processor, monkeypatch, tmp_path):
+    processor = make_processor()
+    (tmp_path / "out.csv").write_text("original\n")
+
+    def broken_to_csv(self, path, **kwargs):
+        with open(path, "w") as f:
+            f.write("half")
+        raise OSError("disk full")
+    monkeypatch.setattr(ai_model_processor.pd.DataFrame, "to_csv", broken_to_csv)
+
+    assert not processor.save_output_file(ai_model_processor.pd.DataFrame({"a": [1]}), "out.csv")
+    assert (tmp_path / "out.csv").read_text() == "original\n"
+    assert not (tmp_path / "out.tmp.csv").exists()
+
+
+def test_rate_limiter_acquire_sleeps_for_debt(fake_clock):
+    limiter = ai_model_processor.RateLimiter(rate=2, burst=1)
+    limiter.acquire()
+    limiter.acquire()
+    assert fake_clock.sleeps == [0.5]
+    # 空闲足够久后令牌补满，不再等待
+    fake_clock.now += 10
+    limiter.acquire()
+    assert fake_clock.sleeps == [0.5]
+
+
+def test_circuit_breaker_waits_out_cooldown(make_processor, fake_clock):
+    processor = make_processor(circuit_breaker_threshold=3, circuit_breaker_cooldown=60)
+    processor.record_api_failure()
+    processor.record_api_failure()
+    processor.record_api_success()
+    processor.record_api_failure()
+    processor.record_api_failure()
+    # 成功后计数清零，只连续失败2次，熔断器未打开
+    assert processor.get_circuit_wait() == 0
+    processor.wait_for_circuit()
+    assert fake_clock.sleeps == []
+
+    processor.record_api_failure()
+    fake_clock.now += 15
+    assert processor.get_circuit_wait() == 45
+    processor.wait_for_circuit()
+    assert fake_clock.sleeps == [45]
+    assert processor.get_circuit_wait() == 0
+
+
+def test_parse_ai_response_truncated_and_nested(make_processor):
+    processor = make_processor()
+    assert processor.parse_ai_response('{"a": {"k": 1}, "b": ') is None
+    assert processor.parse_ai_response('说明 {"a": {"k": 1}, "b": [2]} 结束') == {"a": {"k": 1}, "b": [2]}
+    assert processor.parse_ai_response('["not", "an", "object"]') is None
+
+
+def test_group_duplicate_rows(make_processor):
+    rows = [(0, "a", None), (1, "b", None), (2, "a", None), (3, "a", "x.png")]
+    processor = make_processor()
+    assert processor.group_duplicate_rows(rows) == [([0, 2], "a", None), ([1], "b", None), ([3], "a", "x.png")]
+    processor = make_processor(dedupe_prompts=False)
+    assert len(processor.group_duplicate_rows(rows)) == 4
+
+
+def test_cache_key_and_response_cache(make_processor, monkeypatch, tmp_path):
+    processor = make_processor(response_cache="cache.sqlite")
+    # 分段哈希嵌入图片的结果与对完整data URL哈希一致，已有缓存继续有效
+    monkeypatch.setattr(ai_model_processor, "CACHE_KEY_HASH_CHUNK", 7)
+    embedded = processor.get_cache_key("u", "s", ("QUJDRA==" * 5, "image/png"))
+    assert embedded == processor.get_cache_key("u", "s", "data:image/png;base64," + "QUJDRA==" * 5)
+    assert embedded != processor.get_cache_key("u", "s")
+
+    image = tmp_path / "a.png"
+    image.write_bytes(b"1")
+    before = processor.get_cache_key("u", "s", "a.png")
+    image.write_bytes(b"22")
+    assert processor.get_cache_key("u", "s", "a.png") != before
+
+    assert processor.lookup_response_cache("u", "s") == (processor.get_cache_key("u", "s"), None)
+    processor.response_cache.set(processor.get_cache_key("u", "s"), {"category": "猫"})
+    assert processor.lookup_response_cache("u", "s")[1] == {"category": "猫"}
+    assert processor.response_cache.hits == 1
+    processor.response_cache.close()
+
+
+def test_split_data_url():
+    assert ai_model_processor.split_data_url("data:image/png;base64,QUJD") == ("QUJD", "image/png")
+    assert ai_model_processor.split_data_url("data:image/png,QUJD") is None
+    assert ai_model_processor.split_data_url("data:;base64,QUJD") is None
+    assert ai_model_processor.split_data_url("data:image/png;base64,") is None
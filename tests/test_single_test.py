@@ -0,0 +1,32 @@
+"""single_test.py 中AI响应解析的测试"""
+from single_test import SingleAITest
+
+
+def parse(content):
+    # 解析不依赖配置文件，跳过__init__
+    tester = SingleAITest.__new__(SingleAITest)
+    tester.output = None
+    return tester.parse_ai_response(content)
+
+
+def test_parse_plain_object():
+    assert parse('{"category": "猫", "score": 1}') == {"category": "猫", "score": 1}
+
+
+def test_parse_object_in_code_block():
+    content = '说明文字\n```json\n{"category": "狗", "note": "含有 } 的字符串"}\n```\n{"extra": 1}'
+    assert parse(content) == {"category": "狗", "note": "含有 } 的字符串"}
+
+
+def test_parse_truncated_outer_object_returns_none(capsys):
+    assert parse('{"a": {"k": 1}, "b": ') is None
+    assert "原始响应" in capsys.readouterr().out
+
+
+def test_parse_malformed_outer_object_skips_nested_object(capsys):
+    assert parse('{"a": {"k": 1}, bad}') is None
+    assert "❌ JSON解析错误" in capsys.readouterr().out
+
+
+def test_parse_falls_through_to_next_top_level_object():
+    assert parse('{"a": {"k": 1}, bad} 重试: {"category": "鸟"}') == {"category": "鸟"}